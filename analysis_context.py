@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import time
+from collections import OrderedDict
+from language_model import get_language
+from normalized_text import NormalizedText
+from index_of_coincidence import average_ics, ic, iter_column_counts, vectorized
+
+class AnalysisContext(object):
+    """A ciphertext cleaned once, with its per-period data memoized
+
+    PolialphabeticCipher and CrackVigenere accept a context instead of the
+    text, so guessing the period and trying several periods reuse the same
+    coded text. The columns of each period (bytes of alphabet indices) and
+    their letter counts are kept in two least-recently-used caches, bounded
+    by the number of bytes of the cached columns and by the number of
+    cached columns of counts respectively.
+    """
+    def __init__(self,text,language='English',max_column_bytes=1 << 26,
+                        max_count_columns=4096):
+        self.language_model = get_language(language)
+        self.alphabet = self.language_model.alphabet
+        self.original_text = text
+
+        start = time.perf_counter()
+        self.normalized_text = NormalizedText(text,self.alphabet)
+        self.clean_time = time.perf_counter() - start
+        self.codes = self.normalized_text.codes
+
+        self._columns = _BoundedCache(max_column_bytes)
+        self._counts = _BoundedCache(max_count_columns)
+
+    def columns(self,period):
+        """Get the columns of the coded text for a period"""
+        columns = self._columns.get(period)
+        if columns is None:
+            columns = [self.codes[phase::period] for phase in range(period)]
+            self._columns.put(period,columns,len(self.codes))
+        return columns
+
+    def column_counts(self,periods):
+        """Get the letter counts of the columns of every period in periods
+
+        The periods that are not cached are counted together (see
+        iter_column_counts()).
+        """
+        counts = {}
+        missing = []
+        for period in periods:
+            if period < 1:
+                raise ValueError('The period must be positive: {0}'.format(period))
+            cached = self._counts.get(period)
+            if cached is None:
+                missing.append(period)
+            else:
+                counts[period] = cached
+        for period,period_counts in iter_column_counts(self.codes,missing,len(self.alphabet)):
+            counts[period] = period_counts
+            self._counts.put(period,period_counts,period)
+
+        return [counts[period] for period in periods]
+
+    def average_ics(self,periods):
+        """Get the average ic of the columns of every period in periods
+
+        With NumPy the ICs are computed from the codes directly, which is
+        cheaper than building the counts of many periods; otherwise they are
+        computed from the cached column counts.
+        """
+        if vectorized:
+            return average_ics(self.codes,periods,len(self.alphabet))
+        return [(period,round(sum(map(ic,counts))/period,6))
+                        for period,counts in zip(periods,self.column_counts(periods))]
+
+
+class _BoundedCache(object):
+    """Least-recently-used mapping whose entries have a cost
+
+    The oldest entries are evicted while the total cost exceeds capacity,
+    but the newest entry is always kept.
+    """
+    def __init__(self,capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.total_cost = 0
+
+    def get(self,key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self,key,value,cost):
+        if key in self.entries:
+            self.total_cost -= self.entries.pop(key)[1]
+        self.entries[key] = (value,cost)
+        self.total_cost += cost
+        while self.total_cost > self.capacity and len(self.entries) > 1:
+            _,(_,evicted_cost) = self.entries.popitem(last=False)
+            self.total_cost -= evicted_cost
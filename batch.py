@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from multiprocessing import Pool
+from analysis_context import AnalysisContext
+from crack_vigenere import CrackVigenere
+from period_polialphabetic_cipher import PolialphabeticCipher
+
+def read_directory(path):
+    """Yield (file name, content) for every file of a directory
+
+    The content of a file that cannot be read or decoded is its
+    RecordError, like an invalid record of read_jsonl().
+    """
+    for filename in sorted(os.listdir(path)):
+        filepath = os.path.join(path,filename)
+        if os.path.isfile(filepath):
+            try:
+                with open(filepath) as filehandler:
+                    content = filehandler.read()
+            except (OSError,UnicodeDecodeError) as error:
+                content = RecordError(filename,'File {0} cannot be read: {1}'.format(filename,error))
+            yield filename, content
+
+class RecordError(ValueError):
+    """A JSONL record that cannot be cracked, with the id of its request"""
+    def __init__(self,identifier,message):
+        super().__init__(message)
+        self.identifier = identifier
+
+    def __reduce__(self):
+        # sent to the worker processes as the ciphertext of its task
+        return RecordError, (self.identifier,str(self))
+
+def parse_record(line,line_number):
+    """Parse a JSONL line into (id, ciphertext, record)
+
+    The line must be an object with a "ciphertext" (or "text") string field
+    and an optional "id"; the line number is used when the id is missing.
+    Raises RecordError otherwise.
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as error:
+        raise RecordError(line_number,'Line {0} is not valid JSON: {1}'.format(line_number,error))
+    if not isinstance(record,dict):
+        raise RecordError(line_number,'Line {0} is not a JSON object'.format(line_number))
+
+    identifier = record.get('id',line_number)
+    ciphertext = record['ciphertext'] if 'ciphertext' in record else record.get('text')
+    if not isinstance(ciphertext,str):
+        raise RecordError(identifier,'Line {0} has no "ciphertext" string field'.format(line_number))
+
+    return identifier, ciphertext, record
+
+def read_jsonl(filehandler):
+    """Yield (id, ciphertext) for every JSON object of a JSONL stream
+
+    See parse_record(). The ciphertext of an invalid record is its
+    RecordError, which becomes the error result of the record. The stream
+    should be binary, so that a line that is not UTF-8 is only an invalid
+    record instead of a decoding error of the whole stream.
+    """
+    for line_number,line in enumerate(filehandler,1):
+        if not line.strip():
+            continue
+        try:
+            identifier, ciphertext, _ = parse_record(line,line_number)
+        except RecordError as error:
+            yield error.identifier, error
+        else:
+            yield identifier, ciphertext
+
+def error_result(identifier,error):
+    """The result of a request that could not be cracked because of error"""
+    return {'id':identifier,'period':None,'key':None,'confidence':None,
+                'plaintext':None,'error':'{0}: {1}'.format(type(error).__name__,error)}
+
+def crack(identifier,ciphertext,language='English',variant='vigenere',max_period=None):
+    """Guess the period and crack a ciphertext, returning a JSON-ready dict
+
+    Periods above max_period are not considered.
+    """
+    result = {'id':identifier,'period':None,'key':None,
+                    'confidence':None,'plaintext':None}
+    context = AnalysisContext(ciphertext,language)
+    guess = PolialphabeticCipher(context).analyze(max_period=max_period)
+    if guess.error:
+        result['error'] = guess.error
+        return result
+
+    period, probability = guess.periods[0]
+    cracked = CrackVigenere(context,variant=variant).crack(period,refine=True)
+    result.update(period=period,key=cracked.key,plaintext=cracked.plaintext,
+                            confidence=probability)
+
+    return result
+
+_worker_language = None
+_worker_variant = None
+_worker_max_period = None
+
+def _init_worker(language,variant='vigenere',max_period=None):
+    """Load the language tables once in each worker process"""
+    global _worker_language, _worker_variant, _worker_max_period
+    _worker_language = language
+    _worker_variant = variant
+    _worker_max_period = max_period
+    CrackVigenere.preload(language)
+
+def _crack_task(task):
+    """Crack one (id, ciphertext) task in a worker process
+
+    A task that fails gives an error result instead of stopping the batch.
+    """
+    identifier, ciphertext = task
+    if isinstance(ciphertext,Exception):
+        return error_result(identifier,ciphertext)
+    try:
+        return crack(identifier,ciphertext,_worker_language,_worker_variant,
+                            _worker_max_period)
+    except Exception as error:
+        return error_result(identifier,error)
+
+def crack_batch(tasks,language='English',jobs=None,chunksize=16,variant='vigenere',
+                        max_period=None):
+    """Crack (id, ciphertext) tasks in a process pool
+
+    The tasks are submitted to the workers in chunks of chunksize and the
+    results are yielded in completion order.
+    """
+    with Pool(jobs,initializer=_init_worker,initargs=(language,variant,max_period)) as pool:
+        yield from pool.imap_unordered(_crack_task,tasks,chunksize)
+
+def write_jsonl(results,filehandler):
+    """Write each result as one JSON line as soon as it is available"""
+    for result in results:
+        filehandler.write(json.dumps(result,ensure_ascii=False) + '\n')
+        filehandler.flush()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+from crack_vigenere import CrackVigenere
+from language_model import get_language
+from normalized_text import NormalizedText
+from period_polialphabetic_cipher import PolialphabeticCipher
+from vigenere_cipher import VigenereCipher
+
+def sample_text(size,seed=0):
+    """Build a text of size characters mixing letters, spaces and punctuation"""
+    rng = random.Random(seed)
+    characters = string.ascii_letters*4 + " "*8 + ".,;'-\n"
+    block = ''.join(rng.choice(characters) for _ in range(min(size,1 << 16)))
+    repetitions = size//len(block) + 1
+
+    return (block*repetitions)[:size]
+
+def benchmark_normalization(sizes,alphabet=string.ascii_uppercase):
+    """Time NormalizedText construction and rebuild() for each size"""
+    results = []
+    for size in sizes:
+        text = sample_text(size)
+        start = time.perf_counter()
+        normalized = NormalizedText(text,alphabet)
+        normalize_time = time.perf_counter() - start
+        start = time.perf_counter()
+        normalized.rebuild(normalized.text)
+        rebuild_time = time.perf_counter() - start
+        results.append((size,normalize_time,rebuild_time))
+
+    return results
+
+def synthetic_plaintext(language_model,length,rng,corpus=None):
+    """Build a plaintext of length characters in the language of the model
+
+    Without a corpus the letters are drawn independently with the letter
+    frequencies of the language and grouped in words of five. With a
+    corpus, a slice starting at a random position is taken (the corpus is
+    repeated if it is shorter than length).
+    """
+    if corpus:
+        start = rng.randrange(len(corpus))
+        repetitions = (start+length)//len(corpus) + 1
+        return (corpus*repetitions)[start:start+length]
+
+    alphabet = language_model.alphabet
+    weights = language_model.frequencies
+    blocks = []
+    for block_start in range(0,length,1 << 20):
+        block_length = min(1 << 20,length-block_start)
+        letters = ''.join(rng.choices(alphabet,weights,k=block_length))
+        blocks.append(' '.join([letters[start:start+5] for start in range(0,len(letters),5)]))
+
+    return ' '.join(blocks)[:length]
+
+def _measure(function,memory=True):
+    """Run function and get its result, its wall time and its peak memory
+
+    The peak memory is measured in a second run under tracemalloc, so that
+    the tracing does not slow down the timed run.
+    """
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, elapsed, peak
+
+def run_case(language,length,period,seed,corpus=None,memory=True):
+    """Encrypt a synthetic plaintext with a random key and crack it
+
+    The period stage guesses the period of the ciphertext; the key stage
+    recovers the key with the true period, so that the accuracy of each
+    stage is measured on its own.
+    """
+    language_model = get_language(language)
+    rng = random.Random(seed)
+    plaintext = synthetic_plaintext(language_model,length,rng,corpus)
+    key = ''.join(rng.choices(language_model.alphabet,k=period))
+
+    vigenere = VigenereCipher(language)
+    ciphertext, encrypt_time, encrypt_memory = _measure(
+                                lambda: vigenere.encrypt(plaintext,key),memory)
+    guess, period_time, period_memory = _measure(
+                                lambda: PolialphabeticCipher(ciphertext,language).analyze(),memory)
+    cracked, key_time, key_memory = _measure(
+                                lambda: CrackVigenere(ciphertext,language).crack(period,refine=True),memory)
+
+    guessed_period = guess.period
+    keyword = cracked.key
+    return {'period':guessed_period,'key':keyword,
+                'period_correct':guessed_period == period,
+                'key_correct':keyword == key,
+                'key_letters_correct':sum([a == b for a,b in zip(keyword,key)])/period,
+                'time':{'encrypt':encrypt_time,'period':period_time,'key':key_time},
+                'memory':{'encrypt':encrypt_memory,'period':period_memory,'key':key_memory},
+                'stages':{'period':guess.timings,'key':cracked.timings},
+                'counters':{'period':guess.counters,'key':cracked.counters}}
+
+def run_suite(languages,lengths,periods,samples=1,corpora=None,memory=True):
+    """Run samples cases for every language, length and period
+
+    Returns one result per cell of the grid with the mean wall time and
+    the largest peak memory of each stage, and the fraction of samples
+    whose period and key were recovered.
+    """
+    if corpora is None:
+        corpora = {}
+    results = []
+    for language in languages:
+        # load the language tables before timing anything
+        CrackVigenere('',language)
+        for length in lengths:
+            for period in periods:
+                cases = [run_case(language,length,period,
+                                        '{0}-{1}-{2}-{3}'.format(language,length,period,sample),
+                                        corpora.get(language),memory)
+                                for sample in range(samples)]
+                stages = cases[0]['time'].keys()
+                results.append({
+                    'language':language,'length':length,'period':period,'samples':samples,
+                    'time':{stage:sum([case['time'][stage] for case in cases])/samples
+                                    for stage in stages},
+                    'memory':{stage:max([case['memory'][stage] or 0 for case in cases])
+                                    for stage in stages} if memory else None,
+                    'stages':{step:{stage:sum([case['stages'][step].get(stage,0) for case in cases])/samples
+                                            for stage in cases[0]['stages'][step]}
+                                    for step in ('period','key')},
+                    'period_accuracy':sum([case['period_correct'] for case in cases])/samples,
+                    'key_accuracy':sum([case['key_correct'] for case in cases])/samples,
+                    'key_letter_accuracy':sum([case['key_letters_correct'] for case in cases])/samples})
+
+    return results
+
+def compare(results,baseline,time_threshold=0.5,memory_threshold=0.25,
+                    accuracy_threshold=0.05,min_time=0.01):
+    """Compare results with the ones of a baseline and list the regressions
+
+    A stage regresses when its time grows by more than time_threshold (as a
+    fraction of the baseline, ignoring times below min_time seconds) or its
+    peak memory by more than memory_threshold; an accuracy regresses when
+    it drops by more than accuracy_threshold.
+    """
+    cells = {(result['language'],result['length'],result['period']):result
+                    for result in baseline}
+    regressions = []
+    for result in results:
+        cell = (result['language'],result['length'],result['period'])
+        if cell not in cells:
+            continue
+        old = cells[cell]
+        name = '{0} length={1} period={2}'.format(*cell)
+        for stage,seconds in result['time'].items():
+            old_seconds = old['time'].get(stage)
+            if old_seconds is not None and seconds > min_time and \
+                    seconds > old_seconds*(1+time_threshold) + min_time:
+                regressions.append('{0}: {1} time {2:.4f}s -> {3:.4f}s'.format(
+                                        name,stage,old_seconds,seconds))
+        if result['memory'] and old['memory']:
+            for stage,peak in result['memory'].items():
+                old_peak = old['memory'].get(stage)
+                if old_peak and peak > old_peak*(1+memory_threshold):
+                    regressions.append('{0}: {1} memory {2} -> {3} bytes'.format(
+                                            name,stage,old_peak,peak))
+        for accuracy in ('period_accuracy','key_accuracy','key_letter_accuracy'):
+            if result[accuracy] < old[accuracy] - accuracy_threshold:
+                regressions.append('{0}: {1} {2:.2f} -> {3:.2f}'.format(
+                                        name,accuracy,old[accuracy],result[accuracy]))
+
+    return regressions
+
+def _print_suite(results):
+    """Print one line per cell of the grid"""
+    print("{0:>8} {1:>10} {2:>6} {3:>10} {4:>10} {5:>10} {6:>10} {7:>6} {8:>6} {9:>6}".format(
+                'language','length','period','encrypt','period','key','memory',
+                'p_acc','k_acc','l_acc'))
+    for result in results:
+        peak = max(result['memory'].values()) if result['memory'] else 0
+        print("{0:>8} {1:>10} {2:>6} {3:>9.4f}s {4:>9.4f}s {5:>9.4f}s {6:>8.1f}MB {7:>6.2f} {8:>6.2f} {9:>6.2f}".format(
+                    result['language'][:8],result['length'],result['period'],
+                    result['time']['encrypt'],result['time']['period'],result['time']['key'],
+                    peak/(1 << 20),result['period_accuracy'],result['key_accuracy'],
+                    result['key_letter_accuracy']))
+
+def _parse_size(size):
+    """Parse sizes like 1KB, 10MB or 512"""
+    units = {'KB':1 << 10,'MB':1 << 20,'GB':1 << 30}
+    size = size.upper()
+    for unit,factor in units.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)])*factor)
+    return int(size)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmark the cipher and the cracking pipeline")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    normalization_parser = subparsers.add_parser('normalization',
+                                        help="benchmark the text normalization layer")
+    normalization_parser.add_argument("-s", "--sizes", nargs='+',
+                                        default=['1KB','10KB','100KB','1MB','10MB','100MB'],
+                                        help="text sizes to benchmark (default: 1KB to 100MB)")
+    suite_parser = subparsers.add_parser('suite',
+                                        help="measure time, memory and accuracy on synthetic ciphertexts")
+    suite_parser.add_argument("-l", "--languages", nargs='+', default=['English','Spanish'],
+                                        help="languages of the plaintexts (default: English Spanish)")
+    suite_parser.add_argument("-n", "--lengths", nargs='+', default=['100','1KB','10KB','100KB','1MB'],
+                                        help="ciphertext lengths, up to e.g. 50MB (default: 100 to 1MB)")
+    suite_parser.add_argument("-p", "--periods", nargs='+', type=int,
+                                        default=[1,2,3,5,8,13,30,100,500],
+                                        help="key periods (default: 1 2 3 5 8 13 30 100 500)")
+    suite_parser.add_argument("-r", "--samples", type=int, default=1,
+                                        help="ciphertexts per cell of the grid (default: 1)")
+    suite_parser.add_argument("-c", "--corpus", nargs='+', default=[], metavar='LANGUAGE=FILE',
+                                        help="plaintext corpus of a language (default: random letters)")
+    suite_parser.add_argument("--no-memory", action="store_true",
+                                        help="do not measure the peak memory (twice as fast)")
+    suite_parser.add_argument("-o", "--output-file", type=str,
+                                        help="save the results as a JSON baseline")
+    suite_parser.add_argument("-B", "--baseline", type=str,
+                                        help="fail if the results regress with respect to this baseline")
+    suite_parser.add_argument("--time-threshold", type=float, default=0.5,
+                                        help="allowed relative increase of the time (default: 0.5)")
+    suite_parser.add_argument("--memory-threshold", type=float, default=0.25,
+                                        help="allowed relative increase of the peak memory (default: 0.25)")
+    suite_parser.add_argument("--accuracy-threshold", type=float, default=0.05,
+                                        help="allowed decrease of the accuracies (default: 0.05)")
+    args = parser.parse_args()
+
+    if args.command == 'normalization':
+        print("{0:>12} {1:>12} {2:>12} {3:>12}".format('size','normalize','rebuild','MB/s'))
+        for size,normalize_time,rebuild_time in benchmark_normalization(map(_parse_size,args.sizes)):
+            total_time = normalize_time + rebuild_time
+            print("{0:>12} {1:>11.4f}s {2:>11.4f}s {3:>12.1f}".format(
+                        size,normalize_time,rebuild_time,size/(1 << 20)/total_time))
+        sys.exit()
+
+    corpora = {}
+    for corpus in args.corpus:
+        language, _, filename = corpus.partition('=')
+        with open(filename) as filehandler:
+            corpora[language] = filehandler.read()
+
+    results = run_suite(args.languages,list(map(_parse_size,args.lengths)),args.periods,
+                                args.samples,corpora,not args.no_memory)
+    _print_suite(results)
+
+    if args.output_file:
+        with open(args.output_file,'w') as filehandler:
+            json.dump(results,filehandler,indent=1)
+        print('Saving the baseline in: ' + args.output_file)
+
+    if args.baseline:
+        with open(args.baseline) as filehandler:
+            baseline = json.load(filehandler)
+        regressions = compare(results,baseline,args.time_threshold,
+                                        args.memory_threshold,args.accuracy_threshold)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions with respect to: ' + args.baseline)
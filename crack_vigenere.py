@@ -1,117 +1,252 @@
 #!/usr/bin/env python3
 
-from itertools import cycle
-from operator import itemgetter
-from collections import Counter
-from itertools import zip_longest
-import string
+import time
+from heapq import heappop, heappush
+from math import exp
+from operator import mul
+from analysis_context import AnalysisContext
+from key_refinement import KeyRefiner
+from language_model import get_language
+from tabula_recta import TabulaRecta
+from results import CrackResult, notify
 
 class CrackVigenere(object):
-    """Automatic and manual decoder/solver for Vigenere's cipher """
-    def __init__(self,text,language='English'):
-        if language == 'English':
-            self.alphabet = string.ascii_uppercase
-            self.language_most_common_letters = "ETAOI"
-        elif language == 'Spanish':
-            self.alphabet = "ABCDEFGHIJKLMNÑOPQRSTUVWXYZ"
-            self.language_most_common_letters = "EAOSR"
+    """Automatic and manual decoder/solver for Vigenere's cipher
+
+    variant selects the Beaufort ciphers instead (see TabulaRecta): their
+    ciphertexts are mapped to a Vigenère cipher, solved the same way, and
+    the shifts are converted back to the key of the variant.
+    """
+    # shift tables built once per language and shared by all the instances
+    _shift_scores = {}
+
+    def __init__(self,text,language='English',variant='vigenere'):
+        """text is the ciphertext or an AnalysisContext (then language is ignored)"""
+        if isinstance(text,AnalysisContext):
+            self.context = text
         else:
-            raise ValueError('Language must be English or Spanish')
+            self.context = AnalysisContext(text,language)
+        self.language_model = self.context.language_model
+        self.alphabet = self.language_model.alphabet
+        self.language_most_common_letters = self.language_model.most_common_letters()
+        self.tabula_recta = TabulaRecta(self.alphabet,variant)
+
+        self.original_text = self.context.original_text
+        self.normalized_text = self.context.normalized_text
+        self.clean_time = self.context.clean_time
+        self.text = self.normalized_text.text
+
+        self.shift_scores = CrackVigenere._get_shift_scores(self.language_model)
+
+    @classmethod
+    def preload(cls,language='English'):
+        """Load a language and build its tables before the first ciphertext
+
+        Used by the worker processes of the batch and service modes, so the
+        first request they crack does not pay for it.
+        """
+        language_model = get_language(language)
+        cls._get_shift_scores(language_model)
+        language_model.fitness_range()
+
+    @classmethod
+    def _get_shift_scores(cls,language_model):
+        """Get the table shift_scores[s][c] with the log-probability of the
+        plaintext letter of the ciphertext letter c when the column is
+        shifted by s, building it the first time"""
+        if language_model.name not in cls._shift_scores:
+            log_frequencies = language_model.log_frequencies
+            size = len(language_model.alphabet)
+            cls._shift_scores[language_model.name] = [[log_frequencies[(c-s)%size]
+                                                                    for c in range(size)]
+                                                                    for s in range(size)]
+        return cls._shift_scores[language_model.name]
+
+    def _column_scores(self,period):
+        """Score every shift of every column against the language frequencies
+
+        Each column is reduced to its full letter frequency vector, and the
+        log-likelihood of each shift is one dot product with the precomputed
+        shift_scores row. Returns for each column the (score, shift) pairs
+        sorted from the best one.
+        """
+        columns = [self.tabula_recta.vigenere_counts(counts)
+                            for counts in self.context.column_counts([period])[0]]
+        column_scores = []
+        for counts in columns:
+            scores = [(sum(map(mul,counts,row)),shift)
+                            for shift,row in enumerate(self.shift_scores)]
+            scores.sort(reverse=True)
+            column_scores.append(scores)
+
+        return column_scores
+
+    def _keyword(self,shifts):
+        """Get the keyword whose letters shift the columns by shifts"""
+        return self.tabula_recta.keyword([self.tabula_recta.vigenere_shift(shift)
+                                                        for shift in shifts])
+
+    def _shifts(self,keyword):
+        """Get the shifts of the columns of a keyword (see _keyword())"""
+        return [self.tabula_recta.vigenere_shift(shift)
+                        for shift in self.tabula_recta.key_shifts(keyword)]
+
+    def _columns(self,period):
+        """Get the columns of the text for a period mapped to a Vigenère cipher"""
+        return self.tabula_recta.vigenere_columns(self.context.columns(period))
+
+    def rank_keys(self,period,top=5):
+        """Rank the top keys for a period with their log-likelihood scores
+
+        The best key takes the best shift of every column. The next ones are
+        enumerated in decreasing score by a best-first search that moves one
+        column at a time to its next best shift.
+        """
+        column_scores = self._column_scores(period)
+        ranks = (0,)*period
+        best = sum(scores[0][0] for scores in column_scores)
+        candidates = [(-best,ranks)]
+        seen = {ranks}
+        keys = []
+        while candidates and len(keys) < top:
+            score,ranks = heappop(candidates)
+            shifts = [column_scores[column][rank][1] for column,rank in enumerate(ranks)]
+            keys.append((self._keyword(shifts),-score))
+            for column,rank in enumerate(ranks):
+                if rank + 1 == len(self.alphabet):
+                    continue
+                successor = ranks[:column] + (rank+1,) + ranks[column+1:]
+                if successor in seen:
+                    continue
+                seen.add(successor)
+                scores = column_scores[column]
+                heappush(candidates,(score + scores[rank][0] - scores[rank+1][0],successor))
+
+        return keys
 
-        self.original_text = text
-        self.text = self._clean_text(text)
+    def _refine(self,shifts,time_budget=1.0,restarts=3,seed=None):
+        """Hill-climb the shifts; returns them with their n-gram score and
+        the number of columns scored"""
+        refiner = KeyRefiner(self.normalized_text.codes,self.language_model,len(shifts),
+                                        self._columns(len(shifts)))
+        shifts, score = refiner.refine(shifts,time_budget,restarts,seed)
 
-    def _clean_text(self,text):
-        """Get the characters that belong to the alphabet"""
-        clean_text = ""
-        for letter in text.upper():
-            if letter in self.alphabet:
-                clean_text = ''.join((clean_text,letter))
+        return shifts, score, refiner.columns_scored
 
-        return clean_text
+    def refine_key(self,keyword,time_budget=1.0,restarts=3,seed=None):
+        """Refine a keyword by hill-climbing with the n-gram model of the language
 
-    def _rebuilt_text(self,text,original_text):
-        """Add the characters extracted before with _clean_text() """
-        rebuilt_text = list(text)
-        for pos,letter in enumerate(original_text.upper()):
-            if letter not in self.alphabet:
-                rebuilt_text.insert(pos,letter)
+        Each key letter is changed while the n-gram log-probability of the
+        plaintext improves, rescoring only the n-grams of the changed column.
+        With a unigram model the columns are independent and the keyword
+        from the frequency analysis is already optimal.
+        """
+        if self.language_model.order == 1 or not keyword:
+            return keyword
+        shifts, _, _ = self._refine(self._shifts(keyword),time_budget,restarts,seed)
 
-        return ''.join(rebuilt_text)
+        return self._keyword(shifts)
 
-    def decrypt_text(self,period,manual=False):
+    def _decrypt(self,shifts):
+        """Decrypt the text with the shift of every column
+
+        Each column is decrypted with one translation table in a single pass
+        and written in place in the plaintext.
+        """
+        period = len(shifts)
+        size = len(self.alphabet)
+        plaintext = bytearray(len(self.normalized_text))
+        for phase,column in enumerate(self._columns(period)):
+            plaintext[phase::period] = column.translate(
+                                                self.tabula_recta.tables[-shifts[phase]%size])
+
+        return self.normalized_text.rebuild(self.normalized_text.decode(bytes(plaintext)).lower())
+
+    def crack(self,period,refine=False):
+        """Recover the key for a period and decrypt the text
+
+        Returns a CrackResult with the key, the plaintext, the raw scores,
+        the timing of each stage and the counters, which is also passed to
+        the registered hooks.
+        """
+        result = CrackResult(period)
+        result.timings['clean'] = self.clean_time
+
+        start = time.perf_counter()
+        column_scores = self._column_scores(period)
+        shifts = [scores[0][1] for scores in column_scores]
+        result.score = sum([scores[0][0] for scores in column_scores])
+        result.counters['columns_scored'] = period
+        if refine and self.language_model.order > 1 and period:
+            shifts, result.ngram_score, columns_scored = self._refine(shifts)
+            result.counters['columns_scored'] += columns_scored
+        result.key = self._keyword(shifts)
+        result.timings['key_recovery'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result.plaintext = self._decrypt(shifts)
+        result.timings['rebuild'] = time.perf_counter() - start
+        notify(result)
+
+        return result
+
+    def fitness(self,result):
+        """Mean n-gram log-probability of the plaintext of a CrackResult"""
+        ngrams = len(self.normalized_text) - self.language_model.order + 1
+        if ngrams <= 0:
+            return None
+        if result.ngram_score is not None:
+            score = result.ngram_score
+        elif self.language_model.order == 1:
+            score = result.score
+        else:
+            refiner = KeyRefiner(self.normalized_text.codes,self.language_model,result.period,
+                                            self._columns(result.period))
+            score = refiner.score(self._shifts(result.key))
+
+        return score/ngrams
+
+    def confidence(self,fitness):
+        """Place a fitness between random letters (0) and the language (1)"""
+        uniform, expected = self.language_model.fitness_range()
+        return min(max((fitness-uniform)/(expected-uniform),0.0),1.0)
+
+    def decrypt_text(self,period,manual=False,refine=False):
         """Decrypt a text encrypted with Vigenere's without knowing the key. """
-        subsequences = [[] for i in range(period)]
-        for pos,letter in enumerate(self.text):
-            subsequences[pos%period].append(letter)
-        subsequences = [''.join(subseq) for subseq in subsequences]
-
-        keyword = ""
-        subsequences_decrypted = ['' for _ in subsequences]
-        for index_subseq, subseq in enumerate(subsequences):
-            # mcl(s) = most common letter(s)
-            mcls_ciphertext = Counter(subseq).most_common(5)
-            mcls_ciphertext.sort(key=itemgetter(1,0),reverse=True)
-
-            mcl_plaintext = self.language_most_common_letters[0]
-            encryptions_of_mcl_plaintext = []
-            for index_letter,letter in enumerate(mcls_ciphertext):
-                encrypted_mcl_plaintext = mcls_ciphertext[index_letter][0]
-                offset = (self.alphabet.index(encrypted_mcl_plaintext)
-                                - self.alphabet.index(mcl_plaintext))%len(self.alphabet)
-                matches = 0
-                for letter in mcls_ciphertext:
-                    pos = self.alphabet.index(letter[0])
-                    decrypted_letter = self.alphabet[(pos-offset)%len(self.alphabet)]
-                    if decrypted_letter in self.language_most_common_letters:
-                        matches += 1
-                encryptions_of_mcl_plaintext.append(
-                                                                            (encrypted_mcl_plaintext,matches))
-
-            encryptions_of_mcl_plaintext.sort(key=itemgetter(1),reverse=True)
-            total_matches = sum([matches for _,matches
-                                                    in encryptions_of_mcl_plaintext])
-            encryptions_of_mcl_plaintext = [(letter,
-                                                                    "{0:.2f}%".format(100*m/total_matches))
-                                                                    for letter,m
-                                                                    in encryptions_of_mcl_plaintext]
-
-            if manual:
-                print("Possible encryptions of {0} with their probability: {1}".format(
-                            mcl_plaintext,encryptions_of_mcl_plaintext))
-                while True:
-                    encrypted_mcl_plaintext = input(
-                                                    "Encryption of {0}: ".format(mcl_plaintext)).upper()
-                    if encrypted_mcl_plaintext in self.alphabet:
-                        break
-                    else:
-                        print("Bad character found. Type a letter.")
-            else:
-                encrypted_mcl_plaintext = encryptions_of_mcl_plaintext[0][0]
-
-            offset = (self.alphabet.index(encrypted_mcl_plaintext)
-                                - self.alphabet.index(mcl_plaintext))%len(self.alphabet)
-            keyletter = self.alphabet[offset-1]
-            keyword += keyletter
-            if manual:
-                 print("Key: {0}{1}\n".format(keyword,'?'*(period-len(keyword))))
-
-            subseq_deciphered = subseq
-            for pos, letter in enumerate(self.alphabet):
-                subseq_deciphered = subseq_deciphered.replace(
-                        letter,self.alphabet[(pos-offset)%len(self.alphabet)].lower())
-
-            subsequences_decrypted[index_subseq] = subseq_deciphered
-            # end for
-
-        subsequences_decrypted_mixed = zip_longest(
-                                                                        *subsequences_decrypted,fillvalue='')
-        subsequences_decrypted_mixed = [''.join(subseq_mix) for subseq_mix
-                                                                        in subsequences_decrypted_mixed]
-        plaintext = ''.join(subsequences_decrypted_mixed)
-        plaintext = self._rebuilt_text(plaintext,self.original_text)
-
-        return keyword, plaintext
+        if not manual:
+            result = self.crack(period,refine)
+            return result.key, result.plaintext
+
+        column_scores = self._column_scores(period)
+        shifts = []
+        mcl_plaintext = self.language_most_common_letters[0]
+        for scores in column_scores:
+            # encryptions of the most common letter of the language (mcl)
+            # with the relative likelihood of their shifts
+            best_score = scores[0][0]
+            likelihoods = [(shift,exp(score-best_score)) for score,shift in scores[:5]]
+            total_likelihood = sum([likelihood for _,likelihood in likelihoods])
+            encryptions_of_mcl_plaintext = [(self.alphabet[self.tabula_recta.vigenere_code(
+                                                                        (self.alphabet.index(mcl_plaintext)
+                                                                        + shift)%len(self.alphabet))],
+                                                                "{0:.2f}%".format(100*likelihood/total_likelihood))
+                                                                for shift,likelihood in likelihoods]
+            print("Possible encryptions of {0} with their probability: {1}".format(
+                        mcl_plaintext,encryptions_of_mcl_plaintext))
+            while True:
+                encrypted_mcl_plaintext = input(
+                                                "Encryption of {0}: ".format(mcl_plaintext)).upper()
+                if encrypted_mcl_plaintext in self.alphabet:
+                    break
+                else:
+                    print("Bad character found. Type a letter.")
+            shifts.append((self.tabula_recta.vigenere_code(self.alphabet.index(encrypted_mcl_plaintext))
+                                - self.alphabet.index(mcl_plaintext))%len(self.alphabet))
+
+            keyword = self._keyword(shifts)
+            print("Key: {0}{1}\n".format(keyword,'?'*(period-len(keyword))))
+
+        return self._keyword(shifts), self._decrypt(shifts)
 
 if __name__ == '__main__':
     # Examples in english
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+from collections import Counter
+from itertools import repeat
+from operator import add, mul
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# with NumPy the columns of each period are counted with one bincount
+vectorized = numpy is not None
+
+def column_counts(codes,period,alphabet_size):
+    """Letter counts of each residue class (column) of codes modulo period
+
+    codes is a bytes object of alphabet indices (see NormalizedText). Long
+    columns are counted with one bytes.count per letter, short ones with a
+    single Counter, so the work per column is done in C either way.
+    """
+    columns = [codes[phase::period] for phase in range(period)]
+    if len(codes) >= alphabet_size*period:
+        return [[column.count(code) for code in range(alphabet_size)]
+                        for column in columns]
+
+    letters = range(alphabet_size)
+    return [list(map(Counter(column).get,letters,repeat(0))) for column in columns]
+
+def iter_column_counts(codes,periods,alphabet_size):
+    """Yield (period, column letter counts) for every period in periods
+
+    The periods are grouped in chains that differ by a power of two (3, 6,
+    12, ...). Only the largest period of each chain is counted from the text;
+    the columns of the others are obtained by adding the columns of the
+    previous period that fall on them. One chain is kept in memory at a time.
+    With NumPy the largest period of each chain is counted with a bincount
+    over (phase, letter) pairs instead of one pass per column, shared by the
+    chains whose largest periods divide a small common multiple.
+    """
+    if vectorized:
+        for period,counts in _iter_array_column_counts(codes,periods,alphabet_size):
+            yield period,counts.tolist()
+        return
+
+    for chain in _chains(periods):
+        counts = column_counts(codes,chain[0],alphabet_size)
+        yield chain[0],counts
+        for previous,period in zip(chain,chain[1:]):
+            folded = counts[:period]
+            for start in range(period,previous,period):
+                folded = [list(map(add,column,other))
+                                for column,other in zip(folded,counts[start:start+period])]
+            counts = folded
+            yield period,counts
+
+def _chains(periods):
+    """Group the periods in chains that differ by a power of two, largest first"""
+    chains = {}
+    for period in set(periods):
+        if period < 1:
+            raise ValueError('The period must be positive: {0}'.format(period))
+        odd_part = period
+        while odd_part % 2 == 0:
+            odd_part //= 2
+        chains.setdefault(odd_part,[]).append(period)
+
+    for chain in chains.values():
+        chain.sort(reverse=True)
+        yield chain
+
+def _iter_array_column_counts(codes,periods,alphabet_size):
+    """Yield (period, period x alphabet_size array of counts) using NumPy
+
+    The largest periods of the chains that divide a small common multiple
+    are counted together, with one bincount for the multiple from which
+    each of them is folded (see _shared_multiples()).
+    """
+    codes = numpy.frombuffer(codes,dtype=numpy.uint8)
+    chains = {chain[0]:chain for chain in _chains(periods)}
+    limit = min(len(codes),1 << 22)//(4*alphabet_size)
+    groups = _shared_multiples(chains,limit)
+    if not groups:
+        return
+    # padded to whole rows of the largest multiple, so the keys of each
+    # multiple are built by adding the column offsets to the rows
+    padded = numpy.zeros(len(codes)+max(groups)[0],dtype=numpy.uint8)
+    padded[:len(codes)] = codes
+    for multiple,leaders in groups:
+        rows = -(-len(codes)//multiple)
+        offsets = numpy.arange(multiple,dtype=numpy.intp)*alphabet_size
+        keys = numpy.add(padded[:rows*multiple].reshape(rows,multiple),offsets,dtype=numpy.intp)
+        shared = numpy.bincount(keys.ravel()[:len(codes)],minlength=multiple*alphabet_size)
+        shared = shared.reshape(multiple,alphabet_size)
+        for leader in leaders:
+            counts = shared.reshape(multiple//leader,leader,alphabet_size).sum(axis=0)
+            chain = chains[leader]
+            yield leader,counts
+            for previous,period in zip(chain,chain[1:]):
+                counts = counts.reshape(previous//period,period,alphabet_size).sum(axis=0)
+                yield period,counts
+
+def _shared_multiples(periods,limit):
+    """Group the periods as (multiple, periods that divide it), largest first
+
+    A multiple of at most limit columns that several periods divide is
+    counted once for all of them. Folding it costs one pass over its
+    columns per period, which is less than a pass over the text as long
+    as limit is a small fraction of the length of the text. The periods
+    that do not share a multiple are their own group.
+    """
+    multiples = {}
+    for period in periods:
+        for multiple in range(period,limit+1,period):
+            multiples.setdefault(multiple,[]).append(period)
+
+    groups = []
+    pending = set(periods)
+    for multiple,divisors in sorted(multiples.items(),key=lambda item: (-len(item[1]),item[0])):
+        divisors = [period for period in divisors if period in pending]
+        if len(divisors) > 1:
+            groups.append((multiple,divisors))
+            pending.difference_update(divisors)
+    groups.extend((period,[period]) for period in pending)
+
+    return sorted(groups,reverse=True)
+
+def ic(counts):
+    """Calculate the index of coincidence from the letter counts"""
+    n = sum(counts)
+    if n < 2:
+        return 0.0
+    coincidences = sum(map(mul,counts,counts)) - n
+
+    return round(coincidences/(n*(n-1)),6)
+
+def average_ics(codes,periods,alphabet_size):
+    """Calculate the average of the ic of the columns for every period"""
+    avg_ics = {}
+    if vectorized:
+        # the ics of the columns are computed without building lists of
+        # counts and added in the same order as ic() does
+        for period,counts in _iter_array_column_counts(codes,periods,alphabet_size):
+            column_ics = _array_ics(counts)/10**6
+            avg_ics[period] = round(sum(column_ics.tolist())/period,6)
+        return [(period,avg_ics[period]) for period in periods]
+
+    for period,counts in iter_column_counts(codes,periods,alphabet_size):
+        avg_ics[period] = round(sum(map(ic,counts))/period,6)
+
+    return [(period,avg_ics[period]) for period in periods]
+
+def _array_ics(counts):
+    """The ic() of every row of an array of counts, in millionths
+
+    ic() rounds coincidences/pairs to 6 decimals. The same is done with
+    integers: the quotient of coincidences*10**6 by pairs is rounded up
+    when the remainder is over half of pairs. For less than 2**32 pairs
+    this gives the same digits as rounding the float quotient, except on
+    an exact tie, so the ties and the longer columns are rounded by ic()'s
+    own expression.
+    """
+    n = counts.sum(axis=1)
+    coincidences = (counts*counts).sum(axis=1) - n
+    pairs = n*(n-1)
+    exact = (pairs > 0) & (pairs < 1 << 32)
+    divisors = numpy.where(exact,pairs,1)
+    millionths, remainders = numpy.divmod(numpy.where(exact,coincidences,0)*10**6,divisors)
+    millionths += 2*remainders > divisors
+    inexact = (pairs >= 1 << 32) | (exact & (2*remainders == divisors))
+    for row in numpy.flatnonzero(inexact).tolist():
+        millionths[row] = round(round(int(coincidences[row])/int(pairs[row]),6)*10**6)
+
+    return millionths
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import random
+from collections import deque
+import time
+from itertools import repeat
+from operator import add, mul
+from tabula_recta import TabulaRecta
+
+class KeyRefiner(object):
+    """Hill-climb the key of a periodic cipher with n-gram log-probabilities
+
+    The plaintext is kept as a bytearray of alphabet indices. Changing the
+    shift of one column only changes the n-grams that contain a letter of
+    that column, i.e. the n-grams starting at the residues (column - t) %
+    period for t < n, so only those are rescored, and a column is only
+    revisited after one of its n-1 neighbours changed. The n-gram indices of
+    a residue class are built from strided slices of the plaintext with
+    map(), without a Python loop over the letters; when the period is at
+    least n, the part of the indices that does not depend on the column is
+    computed once per column and reused for every candidate shift.
+    """
+    def __init__(self,codes,language_model,period,columns=None):
+        self.codes = codes
+        self.language_model = language_model
+        self.period = period
+        self.size = len(language_model.alphabet)
+        self.tabula_recta = TabulaRecta(language_model.alphabet)
+        if columns is None:
+            columns = [codes[column::period] for column in range(period)]
+        self.columns = columns
+
+        n = language_model.order
+        # number of n-grams starting at each residue
+        self.counts = [len(range(residue,len(codes)-n+1,period))
+                                for residue in range(period)]
+        self.affected_residues = [sorted({(column-t)%period for t in range(n)})
+                                                for column in range(period)]
+        # number of times a column was scored with every shift
+        self.columns_scored = 0
+
+    def _decrypt_column(self,column,shift):
+        """Decrypt a column with the shift of its key letter"""
+        return self.columns[column].translate(self.tabula_recta.tables[-shift%self.size])
+
+    def _indices(self,plaintext,residue):
+        """Table indices of the n-grams starting at a residue of the period"""
+        count = self.counts[residue]
+        indices = plaintext[residue::self.period][:count]
+        for t in range(1,self.language_model.order):
+            indices = map(add,map(mul,indices,repeat(self.size)),
+                                        plaintext[residue+t::self.period][:count])
+        return indices
+
+    def _score_residues(self,plaintext,residues):
+        """Sum the log-probabilities of the n-grams starting at the residues"""
+        table = self.language_model.ngram_log_probabilities
+        return sum([sum(map(table.__getitem__,self._indices(plaintext,residue)))
+                            for residue in residues if self.counts[residue] > 0])
+
+    def _column_terms(self,plaintext,column):
+        """Split the n-grams containing the column into fixed and variable parts
+
+        Requires period >= n, so that each n-gram has at most one letter of
+        the column. For each affected residue returns the table indices of
+        its n-grams with the letter of the column set to 0, the weights of
+        that letter in the index, and the rows of the column it takes.
+        """
+        n = self.language_model.order
+        saved = plaintext[column::self.period]
+        plaintext[column::self.period] = bytes(len(saved))
+        terms = []
+        for t in range(n):
+            residue = (column-t)%self.period
+            count = self.counts[residue]
+            if count <= 0:
+                continue
+            weight = self.size**(n-1-t)
+            weights = [code*weight for code in range(self.size)]
+            first_row = (residue+t)//self.period
+            terms.append((list(self._indices(plaintext,residue)),weights,
+                                    first_row,first_row+count))
+        plaintext[column::self.period] = saved
+
+        return terms
+
+    def _score_column(self,terms,decrypted_column):
+        """Score the n-grams of _column_terms() with a decrypted column"""
+        table = self.language_model.ngram_log_probabilities
+        score = 0
+        for bases,weights,first_row,last_row in terms:
+            letters = map(weights.__getitem__,decrypted_column[first_row:last_row])
+            score += sum(map(table.__getitem__,map(add,bases,letters)))
+
+        return score
+
+    def score(self,shifts):
+        """Score the plaintext decrypted with the shifts"""
+        plaintext = bytearray(len(self.codes))
+        for column,shift in enumerate(shifts):
+            plaintext[column::self.period] = self._decrypt_column(column,shift)
+
+        return self._score_residues(plaintext,range(self.period))
+
+    def _climb(self,shifts,deadline):
+        """Change one shift at a time until no change improves the score"""
+        shifts = list(shifts)
+        plaintext = bytearray(len(self.codes))
+        for column,shift in enumerate(shifts):
+            plaintext[column::self.period] = self._decrypt_column(column,shift)
+        score = self._score_residues(plaintext,range(self.period))
+
+        n = self.language_model.order
+        pending = deque(range(self.period))
+        queued = set(pending)
+        while pending and time.perf_counter() < deadline:
+            column = pending.popleft()
+            queued.discard(column)
+            self.columns_scored += 1
+            best_shift, best_delta = shifts[column], 0
+            if self.period >= n:
+                terms = self._column_terms(plaintext,column)
+                current = self._score_column(terms,plaintext[column::self.period])
+                for shift in range(self.size):
+                    if shift != shifts[column]:
+                        delta = self._score_column(terms,self._decrypt_column(column,shift)) - current
+                        if delta > best_delta:
+                            best_shift, best_delta = shift, delta
+            else:
+                residues = self.affected_residues[column]
+                current = self._score_residues(plaintext,residues)
+                for shift in range(self.size):
+                    if shift != shifts[column]:
+                        plaintext[column::self.period] = self._decrypt_column(column,shift)
+                        delta = self._score_residues(plaintext,residues) - current
+                        if delta > best_delta:
+                            best_shift, best_delta = shift, delta
+            plaintext[column::self.period] = self._decrypt_column(column,best_shift)
+            if best_shift != shifts[column]:
+                shifts[column] = best_shift
+                score += best_delta
+                # the columns sharing n-grams with this one may now improve
+                for t in range(1-n,n):
+                    neighbour = (column+t)%self.period
+                    if neighbour != column and neighbour not in queued:
+                        pending.append(neighbour)
+                        queued.add(neighbour)
+
+        return shifts, score
+
+    def refine(self,shifts,time_budget=1.0,restarts=3,seed=None):
+        """Refine the shifts of a key within a time budget (in seconds)
+
+        The first climb starts from shifts; each restart randomizes about a
+        third of its positions. Returns the best shifts found and their score.
+        """
+        deadline = time.perf_counter() + time_budget
+        rng = random.Random(seed)
+        best_shifts, best_score = self._climb(shifts,deadline)
+        for _ in range(restarts):
+            if time.perf_counter() >= deadline:
+                break
+            start = list(best_shifts)
+            for column in rng.sample(range(self.period),self.period//3 + 1):
+                start[column] = rng.randrange(self.size)
+            candidate_shifts, candidate_score = self._climb(start,deadline)
+            if candidate_score > best_score:
+                best_shifts, best_score = candidate_shifts, candidate_score
+
+        return best_shifts, best_score
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+import argparse
+import mmap
+import os
+import string
+import struct
+from array import array
+from collections import Counter
+from math import exp, log
+from normalized_text import NormalizedText
+
+class LanguageModel(object):
+    """Alphabet, letter frequencies, IC and n-gram log-probabilities of a language
+
+    ngram_log_probabilities holds len(alphabet)**order values: the
+    log-probability of the n-gram with alphabet indices (c1, ..., cn) is at
+    index c1*m**(n-1) + ... + cn, with m the size of the alphabet. It can be
+    any indexable sequence of floats, e.g. a memoryview over a mapped file.
+    """
+    def __init__(self,name,alphabet,frequencies,ic,ic_weight=1.0,
+                        order=1,ngram_log_probabilities=None,floor=None):
+        if len(frequencies) != len(alphabet):
+            raise ValueError('There must be one frequency per letter')
+        total = sum(frequencies)
+        self.name = name
+        self.alphabet = alphabet
+        self.frequencies = [f/total for f in frequencies]
+        # letters missing from a corpus get a small probability instead of 0
+        self.log_frequencies = [log(f) if f else log(1e-6) for f in self.frequencies]
+        self.ic = ic
+        self.ic_weight = ic_weight
+        self.order = order
+        if ngram_log_probabilities is None:
+            if order != 1:
+                raise ValueError('An n-gram table is required for order {0}'.format(order))
+            ngram_log_probabilities = self.log_frequencies
+        if len(ngram_log_probabilities) != len(alphabet)**order:
+            raise ValueError('The n-gram table must have len(alphabet)**order values')
+        self.ngram_log_probabilities = ngram_log_probabilities
+        if floor is None:
+            floor = min(ngram_log_probabilities)
+        self.floor = floor
+        self._fitness_range = None
+
+    def fitness_range(self):
+        """Mean n-gram log-probability of random letters and of the language
+
+        The first value is the mean of the table, the second one the
+        expectation of the log-probability under the model itself. They are
+        computed once, on first use.
+        """
+        if self._fitness_range is None:
+            table = self.ngram_log_probabilities
+            uniform = sum(table)/len(table)
+            expected = sum([exp(value)*value for value in table])/sum(map(exp,table))
+            self._fitness_range = (uniform,expected)
+        return self._fitness_range
+
+    def most_common_letters(self,count=5):
+        """Get the count most frequent letters of the language"""
+        letters = sorted(zip(self.frequencies,self.alphabet),reverse=True)
+        return ''.join([letter for _,letter in letters[:count]])
+
+    def save(self,filename):
+        """Store the model in the binary format read by load()"""
+        name = self.name.encode('utf-8')
+        alphabet = self.alphabet.encode('utf-8')
+        header = _HEADER.pack(_MAGIC,_VERSION,self.order,len(name),len(alphabet),
+                                            self.ic,self.ic_weight,self.floor)
+        strings = name + alphabet
+        strings += bytes(-(len(header)+len(strings))%8)
+        with open(filename,'wb') as filehandler:
+            filehandler.write(header)
+            filehandler.write(strings)
+            filehandler.write(array('d',self.frequencies).tobytes())
+            filehandler.write(array('f',self.ngram_log_probabilities).tobytes())
+
+    @classmethod
+    def load(cls,filename):
+        """Map a model stored with save(); the n-gram table is read on demand"""
+        with open(filename,'rb') as filehandler:
+            mapped = mmap.mmap(filehandler.fileno(),0,access=mmap.ACCESS_READ)
+        (magic,version,order,name_length,alphabet_length,
+            ic,ic_weight,floor) = _HEADER.unpack_from(mapped)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('{0} is not a language model'.format(filename))
+
+        offset = _HEADER.size
+        name = mapped[offset:offset+name_length].decode('utf-8')
+        offset += name_length
+        alphabet = mapped[offset:offset+alphabet_length].decode('utf-8')
+        offset += alphabet_length
+        offset += -offset%8
+        frequencies = array('d',mapped[offset:offset+8*len(alphabet)])
+        offset += 8*len(alphabet)
+        table = memoryview(mapped)[offset:offset+4*len(alphabet)**order].cast('f')
+
+        return cls(name,alphabet,frequencies,ic,ic_weight,order,table,floor)
+
+
+_MAGIC = b'VLM\x00'
+_VERSION = 1
+# magic, version, order, name length, alphabet length, ic, ic weight, floor
+_HEADER = struct.Struct('<4sHHHHddd')
+
+
+def train(name,corpus,alphabet=string.ascii_uppercase,order=4,ic_weight=1.0):
+    """Build a language model from a plaintext corpus
+
+    The corpus is normalized like the ciphertexts (only the letters of the
+    alphabet are kept), so the n-grams also span word boundaries. Unseen
+    n-grams get the log-probability of a tenth of an occurrence.
+    """
+    codes = NormalizedText(corpus,alphabet).codes
+    if len(codes) < max(order,2):
+        raise ValueError('The corpus is too short')
+
+    size = len(alphabet)
+    letter_counts = Counter(codes)
+    frequencies = [letter_counts[code] for code in range(size)]
+    ic = sum([f*(f-1) for f in frequencies])/(len(codes)*(len(codes)-1))
+
+    ngram_counts = Counter(codes[start:start+order]
+                                        for start in range(len(codes)-order+1))
+    total = sum(ngram_counts.values())
+    floor = log(0.1/total)
+    table = array('f',[floor])*size**order
+    for gram,count in ngram_counts.items():
+        index = 0
+        for code in gram:
+            index = index*size + code
+        table[index] = log(count/total)
+
+    return LanguageModel(name,alphabet,frequencies,round(ic,6),ic_weight,order,table,floor)
+
+
+class LanguageRegistry(object):
+    """Language models by name, loaded lazily on first use
+
+    The models are the *.lm files of the directories (the file name without
+    the extension is the language name) plus the built-in ones. Names are
+    case-insensitive and the files take precedence over the built-in models.
+    """
+    def __init__(self,directories=None,builtins=None):
+        if directories is None:
+            directories = [DEFAULT_DIRECTORY]
+        if builtins is None:
+            builtins = BUILTIN_LANGUAGES
+        self.directories = directories
+        self.builtins = {name.lower():factory for name,factory in builtins.items()}
+        self.models = {}
+
+    def _files(self):
+        """Map the language names to the model files of the directories"""
+        files = {}
+        for directory in reversed(self.directories):
+            if os.path.isdir(directory):
+                for filename in os.listdir(directory):
+                    language, extension = os.path.splitext(filename)
+                    if extension == '.lm':
+                        files[language.lower()] = os.path.join(directory,filename)
+        return files
+
+    def names(self):
+        """Get the names of the available languages"""
+        return sorted(set(self.builtins) | set(self._files()))
+
+    def get(self,name):
+        """Get the model of a language, loading it the first time"""
+        key = name.lower()
+        if key not in self.models:
+            files = self._files()
+            if key in files:
+                self.models[key] = LanguageModel.load(files[key])
+            elif key in self.builtins:
+                self.models[key] = self.builtins[key]()
+            else:
+                raise ValueError('Unknown language: {0} (available: {1})'.format(
+                                            name,', '.join(self.names())))
+        return self.models[key]
+
+
+def _english():
+    return LanguageModel('English',string.ascii_uppercase,
+                            [0.08167,0.01492,0.02782,0.04253,0.12702,0.02228,
+                            0.02015,0.06094,0.06966,0.00153,0.00772,0.04025,
+                            0.02406,0.06749,0.07507,0.01929,0.00095,0.05987,
+                            0.06327,0.09056,0.02758,0.00978,0.02360,0.00150,
+                            0.01974,0.00074],
+                            ic=0.066895)
+
+def _spanish():
+    return LanguageModel('Spanish',"ABCDEFGHIJKLMNÑOPQRSTUVWXYZ",
+                            [0.12027,0.02215,0.04019,0.05010,0.12614,0.00692,
+                            0.01768,0.00703,0.06972,0.00493,0.00011,0.04967,
+                            0.03157,0.06712,0.00311,0.09510,0.02510,0.00877,
+                            0.06871,0.07977,0.04632,0.03196,0.01138,0.00017,
+                            0.00215,0.01008,0.00467],
+                            ic=0.076613,ic_weight=0.1)
+
+BUILTIN_LANGUAGES = {'English':_english,'Spanish':_spanish}
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),'languages')
+
+registry = LanguageRegistry()
+
+def get_language(name):
+    """Get a language model from the default registry"""
+    return registry.get(name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="manage the language models")
+    subparsers = parser.add_subparsers(dest='command',required=True)
+    subparsers.add_parser('list',help="list the available languages")
+    train_parser = subparsers.add_parser('train',help="train a language model from a corpus")
+    train_parser.add_argument("name", help="the name of the language")
+    train_parser.add_argument("corpus", help="a plaintext file in the language")
+    train_parser.add_argument("-a", "--alphabet", type=str,
+                                        help="the alphabet of the language (default: the one of the "
+                                                "installed model with the same name, or A-Z)")
+    train_parser.add_argument("-n", "--order", type=int, default=4,
+                                        help="the length of the n-grams (default: 4)")
+    train_parser.add_argument("-w", "--ic-weight", type=float, default=1.0,
+                                        help="the weight of the IC method when guessing the period")
+    train_parser.add_argument("-o", "--output-file", type=str,
+                                        help="the model file (default: languages/NAME.lm)")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name in registry.names():
+            print(name)
+    else:
+        alphabet = args.alphabet
+        if alphabet is None:
+            try:
+                alphabet = registry.get(args.name).alphabet
+            except ValueError:
+                alphabet = string.ascii_uppercase
+        with open(args.corpus) as filehandler:
+            model = train(args.name,filehandler.read(),alphabet.upper(),args.order,args.ic_weight)
+
+        output_file = args.output_file
+        if output_file is None:
+            os.makedirs(DEFAULT_DIRECTORY,exist_ok=True)
+            output_file = os.path.join(DEFAULT_DIRECTORY,args.name.lower() + '.lm')
+        model.save(output_file)
+        print('Saving the {0}-gram model of {1} in: {2}'.format(args.order,args.name,output_file))
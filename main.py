@@ -1,7 +1,154 @@
+import os
 import sys
 import argparse
+import logging as log
+from functools import partial
+import batch
+import service
 from crack_vigenere import CrackVigenere
+from language_model import get_language
+from online_period_estimator import OnlinePeriodEstimator
 from period_polialphabetic_cipher import PolialphabeticCipher
+from speculation import crack_best
+from tabula_recta import TabulaRecta
+from vigenere_cipher import VigenereCipher
+
+CHUNK_SIZE = 1 << 20
+SAMPLE_SIZE = 1 << 16
+SAMPLE_BLOCK_SIZE = 1 << 12
+STREAM_MAX_PERIOD = 40
+
+def positive_int(value):
+    """argparse type of the options that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be a positive number: {0}".format(value))
+    return number
+
+def read_chunks(filename,chunk_size=CHUNK_SIZE):
+    """Yield the content of a file in chunks of chunk_size characters"""
+    with open(filename) as filehandler:
+        yield from iter(partial(filehandler.read,chunk_size),'')
+
+def crack_sample(filename,language,variant='vigenere',max_period=STREAM_MAX_PERIOD,
+                            sample_size=SAMPLE_SIZE):
+    """Recover the key from the beginning of a file
+
+    The file is read in blocks until the guessed period is stable or
+    sample_size characters have been read. Periods above max_period are not
+    considered. Exits with an error if no period can be guessed.
+    """
+    estimator = OnlinePeriodEstimator(language,max_period)
+    sample = []
+    for block in read_chunks(filename,SAMPLE_BLOCK_SIZE):
+        estimator.update(block)
+        sample.append(block)
+        if estimator.stable or len(sample)*SAMPLE_BLOCK_SIZE >= sample_size:
+            break
+    if estimator.top_period is None:
+        sys.exit(estimator.analyze().error)
+    sample = ''.join(sample)
+    key, _ = CrackVigenere(sample,language,variant).decrypt_text(estimator.top_period,refine=True)
+
+    return key
+
+def crack_windows(filename,language,variant='vigenere',max_period=None,sample_size=SAMPLE_SIZE):
+    """Recover the key of a file whose period is guessed from windows of it
+
+    The period is guessed with PolialphabeticCipher.analyze_sample() without
+    reading the whole file (unless it cannot be told apart), then the key is
+    recovered from the first sample_size characters.
+    """
+    guess = PolialphabeticCipher.from_file(filename,language).analyze_sample(max_period=max_period)
+    if guess.error:
+        sys.exit(guess.error)
+    with open(filename) as filehandler:
+        sample = filehandler.read(sample_size)
+    key, _ = CrackVigenere(sample,language,variant).decrypt_text(guess.period,refine=True)
+
+    return key
+
+def guess_period(args,ciphertext,language):
+    """Guess the period of the ciphertext, returning the cipher and the PeriodGuess
+
+    The ciphertext is None with --sample and --input-file: the period is
+    guessed from windows of the file, which is only read by cipher.load().
+    """
+    if ciphertext is None:
+        cipher = PolialphabeticCipher.from_file(args.input_file,language)
+    else:
+        cipher = PolialphabeticCipher(ciphertext,language)
+    if args.sample:
+        guess = cipher.analyze_sample(max_period=args.max_period)
+    else:
+        guess = cipher.analyze(max_period=args.max_period)
+
+    return cipher, guess
+
+def stream(args,language):
+    """Encrypt/decrypt the input file chunk by chunk"""
+    if args.key:
+        key = args.key
+    elif args.sample:
+        print('Cracking the key from windows of: ' + args.input_file)
+        key = crack_windows(args.input_file,language,args.variant,args.max_period)
+    else:
+        print('Cracking the key from the beginning of: ' + args.input_file)
+        key = crack_sample(args.input_file,language,args.variant,
+                                    args.max_period or STREAM_MAX_PERIOD)
+
+    vigenere = VigenereCipher(language,args.variant)
+    if args.encrypt:
+        chunks = vigenere.encrypt_stream(read_chunks(args.input_file),key)
+    else:
+        chunks = vigenere.decrypt_stream(read_chunks(args.input_file),key)
+
+    # the key is only written when it was cracked: a given key must not
+    # leak into the output, which is also read back by --key
+    if args.output_file:
+        if args.key:
+            print('Saving processed text in: ' + args.output_file)
+        else:
+            print('Saving key and processed text in: ' + args.output_file)
+        with open(args.output_file,'w') as filehandler:
+            if not args.key:
+                filehandler.write('Key: ' + key + '\n')
+            for chunk in chunks:
+                filehandler.write(chunk)
+    else:
+        if not args.key:
+            print("Key: " + key)
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        sys.stdout.write('\n')
+
+def warn_unrefined(language):
+    """Tell the user that the keys will not be refined without n-grams"""
+    language_model = get_language(language)
+    if language_model.order == 1:
+        sys.stderr.write("Note: the {0} model has no n-grams, so the cracked keys are not refined "
+                                "(train one with: python3 language_model.py train {0} CORPUS)\n".format(
+                                    language_model.name))
+
+def crack_many(args,language):
+    """Crack every ciphertext of a directory or JSONL stream into JSONL results"""
+    if args.batch == '-':
+        write_batch(batch.read_jsonl(sys.stdin.buffer),args,language)
+    elif os.path.isdir(args.batch):
+        write_batch(batch.read_directory(args.batch),args,language)
+    else:
+        with open(args.batch,'rb') as filehandler:
+            write_batch(batch.read_jsonl(filehandler),args,language)
+
+def write_batch(tasks,args,language):
+    """Write the results of the tasks to the output file or to stdout"""
+    results = batch.crack_batch(tasks,language,args.jobs,variant=args.variant,
+                                    max_period=args.max_period)
+    if args.output_file:
+        with open(args.output_file,'w') as filehandler:
+            batch.write_jsonl(results,filehandler)
+    else:
+        batch.write_jsonl(results,sys.stdout)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="crack a Vigenère's cipher")
@@ -9,12 +156,43 @@ if __name__ == '__main__':
                                         help="interacts with the user")
     parser.add_argument("-spa", "--spanish", action="store_true",
                                             help="suppose the ciphertext is in Spanish")
+    parser.add_argument("-l", "--language", type=str, default="English",
+                                            help="the language of the ciphertext (English by default, "
+                                                    "see: python3 language_model.py list)")
     parser.add_argument("-i", "--input-file", type=str,
                                             help="the input file with the encrypted text")
     parser.add_argument("-o","--output-file", type=str,
                                             help="the output file with the decrypted text")
+    parser.add_argument("-k", "--key", type=str,
+                                            help="decrypt with this key instead of cracking it")
+    parser.add_argument("-e", "--encrypt", action="store_true",
+                                            help="encrypt with --key instead of decrypting")
+    parser.add_argument("-s", "--stream", action="store_true",
+                                            help="process --input-file in chunks (for files that do not fit in memory)")
+    parser.add_argument("-b", "--batch", type=str,
+                                            help="crack every file of a directory or every line of a JSONL file ('-' for stdin)")
+    parser.add_argument("-j", "--jobs", type=int,
+                                            help="number of worker processes of --batch and --serve (default: number of CPUs; "
+                                                    "0 cracks in the --serve process)")
+    parser.add_argument("-c", "--cipher", dest="variant", default="vigenere",
+                                            choices=TabulaRecta.variants,
+                                            help="the cipher: Vigenère (default), Beaufort or variant Beaufort")
+    parser.add_argument("-t", "--top", type=positive_int, default=3,
+                                            help="number of candidate periods cracked in automatic mode (default: 3)")
+    parser.add_argument("-p", "--max-period", type=int,
+                                            help="longest period considered (default: no limit, "
+                                                    "{0} in --stream mode)".format(STREAM_MAX_PERIOD))
+    parser.add_argument("--sample", action="store_true",
+                                            help="guess the period from windows of the text, using more of it only when unsure (for huge ciphertexts)")
+    parser.add_argument("--serve", type=str, metavar="ADDRESS",
+                                            help="run a cracking service on a Unix socket path or on HOST:PORT")
     args = parser.parse_args()
 
+    if args.encrypt and not args.key:
+        parser.error("--encrypt requires --key")
+    if args.stream and not args.input_file:
+        parser.error("--stream requires --input-file")
+
     if not len(sys.argv) > 1:
         print("If you want to:\n"
                 "\t- Read/write from/to a file.\n"
@@ -23,46 +201,96 @@ if __name__ == '__main__':
                 "use command-line arguments. For more information, type:\n"
                 "\tpython3 " + sys.argv[0] + " --help\n")
 
-    if args.input_file:
+    if args.spanish:
+        language = "Spanish"
+    else:
+        language = args.language
+
+    if not args.key and not args.manual:
+        warn_unrefined(language)
+
+    if args.stream:
+        stream(args,language)
+        sys.exit()
+
+    if args.batch:
+        crack_many(args,language)
+        sys.exit()
+
+    if args.serve:
+        print('Serving on: ' + args.serve)
+        service.serve(args.serve,language,args.jobs,variant=args.variant,
+                            max_period=args.max_period)
+        sys.exit()
+
+    if args.input_file and args.sample and not args.key:
+        print('Guessing the period from windows of: ' + args.input_file)
+        ciphertext = None
+    elif args.input_file:
         print('Getting encrypted text from: ' + args.input_file)
         with open(args.input_file) as filehandler:
             ciphertext = filehandler.read()
     else:
         ciphertext = input("Introduce the ciphertext: ")
 
-    if args.spanish:
-        language = "Spanish"
+    if args.key:
+        vigenere = VigenereCipher(language,args.variant)
+        key = args.key
+        if args.encrypt:
+            plaintext = vigenere.encrypt(ciphertext,key)
+        else:
+            plaintext = vigenere.decrypt(ciphertext,key)
+    elif not args.manual:
+        cipher, guess = guess_period(args,ciphertext,language)
+        if guess.error:
+            sys.exit(guess.error)
+        context = cipher.load()
+        speculation = crack_best(context,guess.periods,args.top,variant=args.variant)
+        period = speculation.winner.period
+        key, plaintext = speculation.winner.key, speculation.winner.plaintext
+        print("Period: {0} (confidence {1:.2f}), other periods tried: {2}".format(
+                    period,speculation.confidence,[(other_period,round(confidence,2))
+                                                    for other_period,confidence in speculation.runners_up]))
+        cracker = CrackVigenere(context,variant=args.variant)
+        print("Other possible keys: {0}".format([(other_key,round(score,2))
+                                                    for other_key,score in cracker.rank_keys(period)[1:]]))
     else:
-        language = "English"
-
-    if not args.manual:
-        periods = PolialphabeticCipher(ciphertext,language).guess_period()
-        period = periods[0][0]
-        key, plaintext = CrackVigenere(ciphertext,language).decrypt_text(period)
-    else:
-        periods = PolialphabeticCipher(ciphertext,language).guess_period()
+        cipher, guess = guess_period(args,ciphertext,language)
+        if guess.error:
+            print(guess.error)
+        context = cipher.load()
+        cracker = CrackVigenere(context,variant=args.variant)
         while True:
-            print("Possible periods: {0}".format(periods))
+            print("Possible periods: {0}".format(guess.formatted()))
             try:
                 period = int(input("Introduce period: "))
             except ValueError:
                 log.warning("Bad character found. Type a number")
                 continue
+            if period < 1:
+                log.warning("The period must be a positive number")
+                continue
             print()
 
-            key, plaintext = CrackVigenere(ciphertext,language).decrypt_text(period,
-                                                                                                manual=args.manual)
+            key, plaintext = cracker.decrypt_text(period,manual=args.manual)
             print("Key: {0}\n{1}...".format(key,plaintext[:1000]))
+            print("Other possible keys: {0}".format([(other_key,round(score,2))
+                                                    for other_key,score in cracker.rank_keys(period)[1:]]))
 
             option = input("\nTry again [y/N]: ")
             if not option.upper() == 'Y':
                 break
 
     if args.output_file:
-        print('Saving key and decrypted text in: ' + args.output_file)
+        if args.key:
+            print('Saving processed text in: ' + args.output_file)
+        else:
+            print('Saving key and decrypted text in: ' + args.output_file)
         with open(args.output_file,'w') as filehandler:
-            filehandler.write('Key: ' + key + '\n')
+            if not args.key:
+                filehandler.write('Key: ' + key + '\n')
             filehandler.write(plaintext)
     else:
-        print("Key: " + key)
+        if not args.key:
+            print("Key: " + key)
         print(plaintext)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+from array import array
+from collections import Counter
+from math import isqrt
+
+class NGramIndex(object):
+    """Distances between consecutive occurrences of the n-grams of a coded text
+
+    The n-grams are slices of the bytes object of alphabet indices (see
+    NormalizedText), which Python hashes directly. Only the last position of
+    each n-gram is kept, and the distance to it is counted as the text is
+    indexed, so the memory depends on the number of distinct n-grams and
+    distances instead of on the length of the text. The index can be
+    extended with more text; the last n-1 letters are kept so that the
+    n-grams crossing the boundary are indexed too.
+    """
+    # distances are gathered in an array and counted in C every block
+    block_size = 1 << 20
+
+    def __init__(self,codes=b'',n=3):
+        if n < 1:
+            raise ValueError('n must be positive')
+        self.n = n
+        self.last_positions = {}
+        self.distance_counts = Counter()
+        self.length = 0
+        self._tail = b''
+        self.extend(codes)
+
+    def extend(self,codes,distances=None):
+        """Index the n-grams of the text indexed so far followed by codes
+
+        If distances (a Counter) is given, the distance from each new
+        occurrence to the previous occurrence of its n-gram is also counted
+        in it.
+        """
+        text = self._tail + codes
+        offset = self.length - len(self._tail)
+        n = self.n
+        last_positions = self.last_positions
+        for block_start in range(0,len(text)-n+1,NGramIndex.block_size):
+            block_distances = array('L')
+            for start in range(block_start,min(block_start+NGramIndex.block_size,len(text)-n+1)):
+                gram = text[start:start+n]
+                previous = last_positions.get(gram)
+                if previous is not None:
+                    block_distances.append(offset+start-previous)
+                last_positions[gram] = offset+start
+            self.distance_counts.update(block_distances)
+            if distances is not None:
+                distances.update(block_distances)
+
+        self.length += len(codes)
+        self._tail = text[max(len(text)-n+1,0):]
+
+    def distances(self):
+        """Count the distances between consecutive occurrences of each n-gram"""
+        return Counter(self.distance_counts)
+
+
+def period_tally(distances,max_period=None,counters=None):
+    """Count each period >= 2 once for every distance it divides
+
+    distances is a Counter of distances (see NGramIndex.distances()). The
+    divisors of each distinct distance are enumerated from its prime
+    factorization, so only the candidate periods are visited. If counters
+    (a dict) is given, the number of distinct distances and of divisors
+    enumerated are added to its 'distances' and 'divisor_checks' entries.
+    """
+    periods = Counter()
+    if not distances:
+        return periods
+
+    smallest_factors = _smallest_prime_factors(max(distances))
+    divisor_checks = 0
+    for distance,occurrences in distances.items():
+        divisors = _divisors(distance,smallest_factors,max_period)
+        divisor_checks += len(divisors)
+        for period in sorted(divisors):
+            periods[period] += occurrences
+    del periods[1]
+    if counters is not None:
+        counters['distances'] = counters.get('distances',0) + len(distances)
+        counters['divisor_checks'] = counters.get('divisor_checks',0) + divisor_checks
+
+    return periods
+
+def most_common_periods(tally,n=5):
+    """The n periods of a tally with the most occurrences, as (period, occurrences)
+
+    Ties are broken by the smaller period, so the result does not depend on
+    the order in which the distances were counted.
+    """
+    return sorted(tally.items(),key=lambda item: (-item[1],item[0]))[:n]
+
+def _smallest_prime_factors(limit):
+    """Sieve the smallest prime factor of every number up to limit"""
+    smallest_factors = array('L',range(limit+1))
+    sieve = bytearray([1])*(isqrt(limit)+1)
+    primes = []
+    for number in range(2,len(sieve)):
+        if sieve[number]:
+            primes.append(number)
+            sieve[number*number::number] = bytes(len(range(number*number,len(sieve),number)))
+    # the smallest primes are written last so they overwrite the largest ones
+    for prime in reversed(primes):
+        multiples = range(prime*prime,limit+1,prime)
+        smallest_factors[prime*prime::prime] = array('L',(prime,))*len(multiples)
+
+    return smallest_factors
+
+def _divisors(number,smallest_factors,limit=None):
+    """Enumerate the divisors of number (up to limit) from its factorization"""
+    divisors = [1]
+    while number > 1:
+        prime = smallest_factors[number]
+        exponent = 0
+        while number % prime == 0:
+            number //= prime
+            exponent += 1
+        powers = [prime**k for k in range(exponent+1)]
+        divisors = [divisor*power for divisor in divisors for power in powers
+                            if limit is None or divisor*power <= limit]
+
+    return divisors
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import re
+
+class NormalizedText(object):
+    """Integer-coded letters of a text plus the layout of the stripped characters
+
+    The text is upper-cased and split once into runs of alphabet letters and
+    runs of the remaining characters. The letters are stored as a bytes object
+    of alphabet indices (the alphabets used here have less than 256 letters)
+    and the stripped runs as two parallel lists: the length of each letter run
+    and the run of characters that follows it. Both the split and rebuilding
+    the original layout are single linear passes.
+    """
+    def __init__(self,text,alphabet):
+        self.alphabet = alphabet
+        parts = _splitter(alphabet).split(text.upper())
+        letter_runs = parts[0::2]
+        self.gaps = parts[1::2]
+        self.run_lengths = [len(run) for run in letter_runs]
+        self.text = ''.join(letter_runs)
+        self.codes = self.text.translate(_encoder(alphabet)).encode('latin-1')
+
+    def __len__(self):
+        return len(self.codes)
+
+    def decode(self,codes):
+        """Map a bytes object of alphabet indices back to letters"""
+        return codes.decode('latin-1').translate(_decoder(self.alphabet))
+
+    def rebuild(self,text):
+        """Add the characters stripped from the original text to text
+
+        text must have one letter for each letter of the original text.
+        """
+        pieces = []
+        start = 0
+        for length,gap in zip(self.run_lengths,self.gaps):
+            pieces.append(text[start:start+length])
+            pieces.append(gap)
+            start += length
+        pieces.append(text[start:])
+
+        return ''.join(pieces)
+
+    def rebuild_codes(self,codes):
+        """Decode a bytes object of alphabet indices and rebuild the layout"""
+        return self.rebuild(self.decode(codes))
+
+
+_splitters = {}
+_encoders = {}
+_decoders = {}
+
+def _splitter(alphabet):
+    """Regex splitting a text into letter runs and captured non-letter runs"""
+    if alphabet not in _splitters:
+        _splitters[alphabet] = re.compile('([^{0}]+)'.format(re.escape(alphabet)))
+    return _splitters[alphabet]
+
+def _encoder(alphabet):
+    """Translation table from letters to the characters chr(index)"""
+    if alphabet not in _encoders:
+        _encoders[alphabet] = {ord(letter):index
+                                            for index,letter in enumerate(alphabet)}
+    return _encoders[alphabet]
+
+def _decoder(alphabet):
+    """Translation table from the characters chr(index) to letters"""
+    if alphabet not in _decoders:
+        _decoders[alphabet] = {index:letter
+                                            for index,letter in enumerate(alphabet)}
+    return _decoders[alphabet]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import time
+from collections import Counter
+from operator import add
+from language_model import get_language
+from normalized_text import NormalizedText
+from index_of_coincidence import ic, iter_column_counts
+from ngram_index import NGramIndex, most_common_periods, period_tally
+from period_polialphabetic_cipher import PolialphabeticCipher
+
+class OnlinePeriodEstimator(PolialphabeticCipher):
+    """Guess the period of a polialphabetic cipher from text arriving in chunks
+
+    update() only processes the new letters: it extends the n-gram index,
+    adds the distances of the new repetitions to the tally of Kasiski's
+    periods and adds the letters to the column counts of every period up to
+    max_period. guess_period() combines them as PolialphabeticCipher does,
+    at a cost that does not depend on the length of the text. Periods above
+    max_period are not considered.
+    """
+    def __init__(self,language='English',max_period=40,n=3,patience=3):
+        self.language_model = get_language(language)
+        self.language = self.language_model.name
+        self.alphabet = self.language_model.alphabet
+        self.language_ic = self.language_model.ic
+
+        self.max_period = max_period
+        self.patience = patience
+        self.ngram_index = NGramIndex(n=n)
+        self.period_tally = Counter()
+        self.repeated_ngrams = 0
+        size = len(self.alphabet)
+        self.counts = {period:[[0]*size for _ in range(period)]
+                                for period in range(1,max_period+1)}
+        self.length = 0
+        self.clean_time = 0.0
+        self.index_time = 0.0
+        self.top_period = None
+        self.unchanged_updates = 0
+
+    @property
+    def stable(self):
+        """Whether the top period has not changed in the last patience updates"""
+        return self.top_period is not None and self.unchanged_updates >= self.patience
+
+    def update(self,chunk):
+        """Add the letters of a chunk of ciphertext to the estimation"""
+        start = time.perf_counter()
+        codes = NormalizedText(chunk,self.alphabet).codes
+        self.clean_time += time.perf_counter() - start
+        if not codes:
+            return
+
+        start = time.perf_counter()
+        distances = Counter()
+        self.ngram_index.extend(codes,distances)
+        self.period_tally.update(period_tally(distances,self.max_period))
+        self.repeated_ngrams += sum(distances.values())
+        self.index_time += time.perf_counter() - start
+
+        # the columns of the chunk are shifted by the letters seen before it
+        periods = range(1,self.max_period+1)
+        for period,chunk_counts in iter_column_counts(codes,periods,len(self.alphabet)):
+            columns = self.counts[period]
+            phase = self.length % period
+            for column,counts in enumerate(chunk_counts):
+                index = (phase+column) % period
+                columns[index] = list(map(add,columns[index],counts))
+        self.length += len(codes)
+
+        top_period = self.analyze().period
+        if top_period is not None and top_period == self.top_period:
+            self.unchanged_updates += 1
+        else:
+            self.top_period = top_period
+            self.unchanged_updates = 0
+
+    def _kasiski(self,n,max_period,result):
+        """Kasiski's method from the tally of the repetitions so far"""
+        result.timings['ngram_index'] = self.index_time
+        result.counters['repeated_ngrams'] = self.repeated_ngrams
+
+        start = time.perf_counter()
+        periods = most_common_periods(self.period_tally)
+        total_occurrences = sum([occurrences for _,occurrences in periods])
+        periods = [(period,occurrences/total_occurrences)
+                            for period,occurrences in periods]
+        result.timings['kasiski'] = time.perf_counter() - start
+
+        return periods
+
+    def avg_ics(self,periods):
+        """Calculate the average ic of the columns of every period so far"""
+        return [(period,round(sum(map(ic,self.counts[period]))/period,6))
+                        for period in periods]
@@ -1,100 +1,110 @@
 #!/usr/bin/env python3
 
-from operator import itemgetter
+import os
+import random
+import time
 from collections import Counter
-import string
+from operator import itemgetter
+from statistics import mean, stdev
+from analysis_context import AnalysisContext
+from index_of_coincidence import average_ics
+from language_model import get_language
+from ngram_index import NGramIndex, most_common_periods, period_tally
+from normalized_text import NormalizedText
+from results import PeriodGuess, notify
 
 class PolialphabeticCipher(object):
     """Guess the period of a polialphabetic cipher"""
-    english_ic = 0.066895
-    spanish_ic = 0.076613
+    # the ICs are rounded to 6 decimals, so an equal IC is a difference of 0
+    min_ic_difference = 1e-7
+    # defaults of analyze_sample(): letters per window, windows of the first
+    # round and standard errors of the confidence intervals
+    sample_window = 2048
+    sample_windows = 8
+    sample_z = 1.96
+    # the file of a cipher created with from_file(), read by load()
+    filename = None
+    context = None
 
     def __init__(self,text,language='English'):
-        if language == 'English':
-            self.language = 'English'
-            self.alphabet = string.ascii_uppercase
-            self.language_ic = PolialphabeticCipher.english_ic
-        elif language == 'Spanish':
-            self.language = 'Spanish'
-            self.alphabet = "ABCDEFGHIJKLMNÑOPQRSTUVWXYZ"
-            self.language_ic = PolialphabeticCipher.spanish_ic
+        """text is the ciphertext or an AnalysisContext (then language is ignored)"""
+        if isinstance(text,AnalysisContext):
+            context = text
         else:
-            raise ValueError('Language must be English or Spanish')
-
-        self.text = self._clean_text(text)
-
-    def _clean_text(self,text):
-        """Get the characters that belong to the alphabet"""
-        clean_text = ""
-        for letter in text.upper():
-            if letter in self.alphabet:
-                clean_text = ''.join((clean_text,letter))
-
-        return clean_text
-
-    def _get_3_grams(self):
-        """Get the 3-grams that are repeated with their occurrences"""
-        three_grams = {}
-        for i in range(len(self.text)-3+1):
-            currentgram = self.text[i:i+3]
-            three_grams[currentgram] = three_grams.get(currentgram,0) + 1
-
-        three_grams = sorted(three_grams.items(), key=itemgetter(1), reverse=True)
-        three_grams = [(gram,occurrences)
-                                    for gram,occurrences in three_grams
-                                    if occurrences > 1]
-
-        return three_grams
-
-    def kasiski_method(self):
-        """Compute the possible periods using Kasiski's method."""
-        ngrams = self._get_3_grams()
-        if not ngrams:
-            print("Kasiski's method failed: no 3-grams found. Aborting...")
-            return
+            context = AnalysisContext(text,language)
+        self._set_language(context.language_model)
+        self._set_context(context)
+
+    @classmethod
+    def from_file(cls,filename,language='English'):
+        """Guess the period of the ciphertext of a file, reading it lazily
+
+        analyze_sample() only reads and cleans its windows of the file; the
+        whole file is read the first time the whole text is needed (see
+        load()).
+        """
+        cipher = cls.__new__(cls)
+        cipher._set_language(get_language(language))
+        cipher.filename = filename
+        return cipher
 
-        periods = []
-        for ngram,occurrences in ngrams:
-            next_pos = 0
-            for i in range(occurrences-1):
-                current_pos = self.text.find(ngram,next_pos)
-                next_pos = self.text.find(ngram,current_pos+1)
-                distance = next_pos - current_pos
+    def _set_language(self,language_model):
+        self.language_model = language_model
+        self.language = self.language_model.name
+        self.alphabet = self.language_model.alphabet
+        self.language_ic = self.language_model.ic
 
-                for period in range(2,distance+1):
-                    if distance % period == 0:
-                        periods.append(period)
+    def _set_context(self,context):
+        self.context = context
+        self.normalized_text = self.context.normalized_text
+        self.clean_time = self.context.clean_time
+        self.text = self.normalized_text.text
+        self.length = len(self.text)
 
-        periods = Counter(periods).most_common(5)
+    def load(self):
+        """Read the whole file of a cipher created with from_file()
+
+        Returns the AnalysisContext of the text (nothing is read twice).
+        """
+        if self.context is None and self.filename is not None:
+            with open(self.filename) as filehandler:
+                self._set_context(AnalysisContext(filehandler.read(),self.language))
+        return self.context
+
+    def _kasiski(self,n,max_period,result):
+        """Kasiski's method, recording its timings and counters in result"""
+        self.load()
+        start = time.perf_counter()
+        ngram_index = NGramIndex(self.normalized_text.codes,n)
+        distances = ngram_index.distances()
+        result.timings['ngram_index'] = time.perf_counter() - start
+        result.counters['repeated_ngrams'] = sum(distances.values())
+
+        start = time.perf_counter()
+        periods = most_common_periods(period_tally(distances,max_period,result.counters))
         total_occurrences = sum([occurrences for _,occurrences in periods])
         periods = [(period,occurrences/total_occurrences)
                             for period,occurrences in periods]
+        result.timings['kasiski'] = time.perf_counter() - start
 
         return periods
 
-    def _ic(self,text):
-        """Calculate the index of coincidence"""
-        ic = 0
-        n = len(text)
-        for f in Counter(text).values():
-            ic +=  (f*(f-1))/(n*(n-1))
+    def kasiski_method(self,n=3,max_period=None):
+        """Compute the possible periods using Kasiski's method.
 
-        return float("{0:.6f}".format(ic))
+        Returns an empty list if no n-gram is repeated.
+        """
+        return self._kasiski(n,max_period,PeriodGuess())
 
-    def _avg_ic(self,period):
-        """Calculate the average of the ic of the period-subsequences"""
-        subsequences = [[] for i in range(period)]
-        for pos,letter in enumerate(self.text):
-            subsequences[pos%period].append(letter)
-        subsequences = [''.join(subseq) for subseq in subsequences]
-        avg_ic = sum([self._ic(subseq) for subseq in subsequences])/period
+    def avg_ics(self,periods):
+        """Calculate the average ic of the period-subsequences for every period"""
+        self.load()
+        return self.context.average_ics(periods)
 
-        return float("{0:.6f}".format(avg_ic))
-
-    def _exp_ic(self,period):
+    def _exp_ic(self,period,length=None):
         """Calculate the expected value of the IC for a cipher of period d"""
         d = period
-        n = len(self.text)
+        n = self.length if length is None else length
         return 1/d*(n-d)/(n-1)*self.language_ic + (d-1)/d*n/(n-1)*1/len(self.alphabet)
 
     def ic_method(self,periods=None):
@@ -102,19 +112,24 @@ class PolialphabeticCipher(object):
         if periods is None:
             periods = range(1,21)
 
-        avg_ics = []
-        for period in periods:
-            avg_ics.append( (period,self._avg_ic(period)) )
-        difference_respect_language_ic = [(period,abs(avg_ic-self.language_ic))
+        avg_ics = self.avg_ics(list(periods) + [1])
+        text_ic = avg_ics.pop()[1]
+
+        return self._ic_probabilities(periods,avg_ics,text_ic,self.length)
+
+    def _ic_probabilities(self,periods,avg_ics,text_ic,length):
+        """Rank the periods from the average ics of a text of that length"""
+        difference_respect_language_ic = [(period,max(abs(avg_ic-self.language_ic),
+                                                                                    PolialphabeticCipher.min_ic_difference))
                                                                     for period,avg_ic in avg_ics]
         total_diff = sum([1/diff for period,diff
                                     in difference_respect_language_ic])
         p1 = [(period,1/diff/total_diff )
                 for period,diff in difference_respect_language_ic]
 
-        text_ic = self._ic(self.text)
-        periods_ic = [(period,self._exp_ic(period)) for period in periods]
-        difference_respect_text_ic = [(period,abs(period_ic-text_ic))
+        periods_ic = [(period,self._exp_ic(period,length)) for period in periods]
+        difference_respect_text_ic = [(period,max(abs(period_ic-text_ic),
+                                                                            PolialphabeticCipher.min_ic_difference))
                                                         for period,period_ic in periods_ic]
         total_diff = sum([1/diff for period,diff
                                     in difference_respect_text_ic])
@@ -131,30 +146,191 @@ class PolialphabeticCipher(object):
 
         return periods_with_probability
 
-    def guess_period(self):
-        """Guess the period of the polialphabetic cipher using Kasiski's and IC method"""
-        kasiski = self.kasiski_method()
-        kasiski.sort()
+    def analyze(self,n=3,max_period=None):
+        """Guess the period using Kasiski's and IC method
+
+        Returns a PeriodGuess with the raw probabilities, the timing of each
+        stage and the counters, which is also passed to the registered hooks.
+        """
+        result = PeriodGuess()
+        self._analyze(n,max_period,result)
+        notify(result)
+
+        return result
+
+    def _analyze(self,n,max_period,result):
+        """Guess the period from the whole text, filling result"""
+        self.load()
+        result.timings['clean'] = self.clean_time
+        kasiski = self._kasiski(n,max_period,result)
         if not kasiski:
+            result.error = "Kasiski's method failed: no repeated {0}-grams found".format(n)
             return
+
+        kasiski.sort()
         periods = [period for period,_ in kasiski]
+        start = time.perf_counter()
         ic = self.ic_method(periods)
         ic.sort()
+        result.timings['ic'] = time.perf_counter() - start
+        result.counters['periods_evaluated'] = len(periods) + 1
 
-        if self.language == 'Spanish':
-            weight = 0.1
-        else:
-            weight = 1
+        weight = self.language_model.ic_weight
         guessed_periods = [(period,kasiski[index][1]+weight*ic[index][1])
                                             for index,period in enumerate(periods)]
 
         guessed_periods.sort(key=itemgetter(1),reverse=True)
         total_prob = sum([probability
                                         for _,probability in guessed_periods])
-        guessed_periods = [(period,"{0:.2f}%".format(100*probability/total_prob))
-                                            for period,probability in guessed_periods]
+        result.periods = [(period,probability/total_prob)
+                                    for period,probability in guessed_periods]
+        result.kasiski = kasiski
+        result.ic = ic
+
+    def analyze_sample(self,n=3,max_period=None,window=None,windows=None,z=None,seed=None):
+        """Guess the period from windows of the text, escalating while unsure
+
+        Kasiski's and IC method are applied to each window of window
+        letters and the combined probability of each candidate period is
+        averaged over the windows; result.intervals holds its confidence
+        interval (the mean plus or minus z standard errors). While the
+        intervals of the two best periods overlap the number of windows is
+        doubled, and once the windows would cover the text the whole text
+        is analyzed (see analyze()). The windows are evenly strided, or
+        drawn at random with the given seed.
+
+        With a cipher created with from_file() the windows are window
+        characters read from the file and cleaned one by one, so the time
+        and the memory depend on the number of windows needed and not on the
+        size of the file, until the whole text has to be analyzed.
+        """
+        window = window or PolialphabeticCipher.sample_window
+        windows = max(windows or PolialphabeticCipher.sample_windows,2)
+        z = PolialphabeticCipher.sample_z if z is None else z
+        rng = random.Random(seed) if seed is not None else None
+
+        if self.context is None:
+            length = os.path.getsize(self.filename)
+        else:
+            length = self.length
+
+        start = time.perf_counter()
+        rounds = 0
+        while windows*window < length:
+            rounds += 1
+            if rng is None:
+                stride = (length-window)//(windows-1)
+                starts = [index*stride for index in range(windows)]
+            else:
+                starts = sorted(rng.sample(range(length-window+1),windows))
+            result = PeriodGuess()
+            result.counters['rounds'] = rounds
+            self._analyze_windows(self._windows(starts,window,result),n,max_period,z,result)
+            if result.separated:
+                notify(result)
+                return result
+            windows *= 2
+
+        result = PeriodGuess()
+        result.timings['sample'] = time.perf_counter() - start
+        result.counters['rounds'] = rounds
+        self._analyze(n,max_period,result)
+        notify(result)
+
+        return result
+
+    def _windows(self,starts,window,result):
+        """Get the coded windows of the text (or of the file) at starts"""
+        if self.context is not None:
+            result.timings['clean'] = self.clean_time
+            codes = self.normalized_text.codes
+            return [codes[start:start+window] for start in starts]
+
+        # a window may cut a character in two, which is then dropped
+        start_time = time.perf_counter()
+        samples = []
+        with open(self.filename,'rb') as filehandler:
+            for start in starts:
+                filehandler.seek(start)
+                text = filehandler.read(window).decode('utf-8','ignore')
+                samples.append(NormalizedText(text,self.alphabet).codes)
+        result.timings['clean'] = time.perf_counter() - start_time
+
+        return samples
+
+    def _analyze_windows(self,samples,n,max_period,z,result):
+        """Guess the period from the coded windows of the text, filling result"""
+        samples = [sample for sample in samples if len(sample) > 1]
+        result.counters['windows'] = len(samples)
+        result.counters['sampled_letters'] = sum(map(len,samples))
+        if len(samples) < 2:
+            result.error = 'Not enough letters in the windows'
+            return
+
+        start = time.perf_counter()
+        tallies = []
+        pooled_tally = Counter()
+        result.counters['repeated_ngrams'] = 0
+        for sample in samples:
+            distances = NGramIndex(sample,n).distances()
+            result.counters['repeated_ngrams'] += sum(distances.values())
+            tally = period_tally(distances,max_period,result.counters)
+            tallies.append(tally)
+            pooled_tally.update(tally)
+        kasiski = most_common_periods(pooled_tally)
+        result.timings['kasiski'] = time.perf_counter() - start
+        if not kasiski:
+            result.error = "Kasiski's method failed: no repeated {0}-grams found".format(n)
+            return
+
+        start = time.perf_counter()
+        periods = sorted([period for period,_ in kasiski])
+        total_occurrences = sum([occurrences for _,occurrences in kasiski])
+        result.kasiski = [(period,pooled_tally[period]/total_occurrences) for period in periods]
+
+        # per window probabilities of the candidate periods, combined as analyze() does
+        weight = self.language_model.ic_weight
+        window_ics = []
+        window_periods = []
+        for sample,tally in zip(samples,tallies):
+            occurrences = sum([tally[period] for period in periods])
+            kasiski = [tally[period]/occurrences if occurrences else 1/len(periods)
+                                for period in periods]
+            avg_ics = average_ics(sample,periods + [1],len(self.alphabet))
+            text_ic = avg_ics.pop()[1]
+            ic_probabilities = dict(self._ic_probabilities(periods,avg_ics,text_ic,len(sample)))
+            window_ics.append([ic_probabilities[period] for period in periods])
+            guessed_periods = [probability+weight*ic_probabilities[period]
+                                            for period,probability in zip(periods,kasiski)]
+            total_prob = sum(guessed_periods)
+            window_periods.append([probability/total_prob for probability in guessed_periods])
+        result.counters['periods_evaluated'] = len(periods) + 1
+
+        result.ic = [(period,mean(probabilities))
+                            for period,probabilities in zip(periods,zip(*window_ics))]
+        intervals = []
+        for period,probabilities in zip(periods,zip(*window_periods)):
+            probability = mean(probabilities)
+            margin = z*stdev(probabilities)/len(probabilities)**0.5
+            intervals.append((period,probability,max(probability-margin,0.0),
+                                                    min(probability+margin,1.0)))
+        intervals.sort(key=itemgetter(1),reverse=True)
+        result.periods = [(period,probability) for period,probability,_,_ in intervals]
+        result.intervals = [(period,low,high) for period,_,low,high in intervals]
+        result.timings['ic'] = time.perf_counter() - start
+
+    def guess_period(self,sample=False):
+        """Guess the period of the polialphabetic cipher using Kasiski's and IC method
+
+        Returns the periods with their probability as a percentage string,
+        or None if Kasiski's method failed (see analyze()). With sample, the
+        period is estimated from windows of the text (see analyze_sample()).
+        """
+        result = self.analyze_sample() if sample else self.analyze()
+        if result.error:
+            return
 
-        return guessed_periods
+        return result.formatted()
 
 if __name__ == '__main__':
     # Examples english
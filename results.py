@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+class PeriodGuess(object):
+    """Result of guessing the period of a ciphertext
+
+    periods, kasiski and ic are lists of (period, probability) with the
+    probabilities as floats: the combined ranking (best first) and the ones
+    of each method. timings maps each stage (clean, ngram_index, kasiski,
+    ic) to its wall time in seconds and counters holds the work done
+    (repeated_ngrams, distances, divisor_checks, periods_evaluated).
+    error describes why no period could be guessed, if so.
+
+    When the period is estimated from windows of the text (see
+    PolialphabeticCipher.analyze_sample()), intervals holds (period, low,
+    high) with the confidence interval of each probability, in the order of
+    periods, and the counters also hold the rounds, windows and
+    sampled_letters. If the sampling ended up analyzing the whole text,
+    intervals is empty and timings['sample'] is the time spent sampling.
+    """
+    def __init__(self):
+        self.periods = []
+        self.kasiski = []
+        self.ic = []
+        self.intervals = []
+        self.timings = {}
+        self.counters = {}
+        self.error = None
+
+    @property
+    def period(self):
+        """The most probable period, or None"""
+        return self.periods[0][0] if self.periods else None
+
+    @property
+    def separated(self):
+        """Whether the most probable period is told apart from the others
+
+        Without confidence intervals (the whole text was analyzed) any
+        guessed period is taken as it is.
+        """
+        if not self.intervals:
+            return bool(self.periods)
+        if len(self.intervals) == 1:
+            return True
+        return self.intervals[0][1] > self.intervals[1][2]
+
+    def formatted(self):
+        """Get the ranking with the probabilities as percentage strings"""
+        return [(period,"{0:.2f}%".format(100*probability))
+                        for period,probability in self.periods]
+
+    def as_dict(self):
+        """Get the result as a JSON-ready dict"""
+        return {'period':self.period,'periods':self.periods,'kasiski':self.kasiski,
+                    'ic':self.ic,'intervals':self.intervals,'timings':self.timings,
+                    'counters':self.counters,
+                    'error':self.error}
+
+
+class CrackResult(object):
+    """Result of recovering the key of a ciphertext for a given period
+
+    score is the log-likelihood of the key found by the frequency analysis
+    and ngram_score the n-gram log-probability of the plaintext after the
+    refinement (None if the key was not refined). timings maps each stage
+    (clean, key_recovery, rebuild) to its wall time in seconds and counters
+    holds the work done (columns_scored).
+    """
+    def __init__(self,period):
+        self.period = period
+        self.key = None
+        self.plaintext = None
+        self.score = None
+        self.ngram_score = None
+        self.timings = {}
+        self.counters = {}
+
+    def as_dict(self):
+        """Get the result as a JSON-ready dict (without the plaintext)"""
+        return {'period':self.period,'key':self.key,'score':self.score,
+                    'ngram_score':self.ngram_score,'timings':self.timings,
+                    'counters':self.counters}
+
+
+class Speculation(object):
+    """Result of cracking several candidate periods and keeping the best one
+
+    candidates holds (period, fitness, confidence) for every period
+    cracked, in cracking order; stopped_early tells whether the remaining
+    candidates were skipped because one passed the confidence threshold.
+    winner is the CrackResult kept, whose period and key are reduced when
+    the key repeats a shorter one.
+    """
+    def __init__(self):
+        self.candidates = []
+        self.winner = None
+        self.winner_index = None
+        self.confidence = None
+        self.stopped_early = False
+        self.timings = {}
+
+    @property
+    def runners_up(self):
+        """The (period, confidence) of the candidates that were not kept"""
+        return [(period,confidence) for index,(period,_,confidence) in enumerate(self.candidates)
+                        if index != self.winner_index]
+
+    def as_dict(self):
+        """Get the result as a JSON-ready dict (without the plaintext)"""
+        return {'winner':self.winner.as_dict() if self.winner else None,
+                    'confidence':self.confidence,'candidates':self.candidates,
+                    'stopped_early':self.stopped_early,'timings':self.timings}
+
+
+_hooks = []
+
+def add_hook(hook):
+    """Call hook(result) with every PeriodGuess, CrackResult and Speculation produced"""
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    """Stop calling a hook registered with add_hook()"""
+    _hooks.remove(hook)
+
+def notify(result):
+    """Pass a result to the registered hooks (nothing to do without hooks)"""
+    for hook in _hooks:
+        hook(result)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import batch
+from crack_vigenere import CrackVigenere
+from language_model import get_language
+from tabula_recta import TabulaRecta
+
+class CrackService(object):
+    """Resident cracking service answering JSON lines over a socket
+
+    Each request is a line with a JSON object like the ones of the batch
+    mode ({"id": 1, "ciphertext": "..."}, optionally with a "language" and
+    a "variant" of the cipher) and
+    each answer is the line of batch.crack() for it, written as soon as it
+    is ready (so possibly out of order, matched by the id). An invalid
+    request, or one that fails, is answered with the error and its id
+    without affecting the other requests.
+
+    The requests of all the connections go through one bounded queue: when
+    it is full the connections stop being read, so the clients are slowed
+    down instead of piling up memory. A batcher takes up to batch_size
+    requests at a time and sends each micro-batch to a pool of warm
+    workers, with at most one batch in flight per worker. With jobs=0 the
+    requests are cracked in a thread of the service process, which avoids
+    the round trip to another process for short intercepts. A request
+    line longer than line_limit bytes is answered with an error.
+    """
+    line_limit = 1 << 26
+
+    def __init__(self,language='English',jobs=None,batch_size=16,queue_size=1024,
+                        variant='vigenere',max_period=None):
+        self.language = language
+        self.variant = variant
+        self.max_period = max_period
+        self.jobs = os.cpu_count() if jobs is None else jobs
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.queue = None
+        self.executor = None
+
+    def _start_executor(self):
+        """Create the pool of workers with the language tables loaded"""
+        if self.jobs == 0:
+            CrackVigenere.preload(self.language)
+            return ThreadPoolExecutor(1)
+        # the workers are spawned instead of forked: a forked worker would
+        # inherit the sockets of the open connections and keep them open
+        # after the service closes them, so the clients would never see the end
+        return ProcessPoolExecutor(self.jobs,mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=batch._init_worker,
+                                            initargs=(self.language,self.variant,self.max_period))
+
+    async def _batcher(self):
+        """Group the queued requests into micro-batches for the workers
+
+        A worker is reserved before taking the requests, so while all the
+        workers are busy the requests accumulate in the queue and the next
+        batch takes all of them (up to batch_size), without delaying a
+        request when a worker is free.
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(max(self.jobs,1))
+        while True:
+            await in_flight.acquire()
+            requests = [await self.queue.get()]
+            while len(requests) < self.batch_size and not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+
+            tasks = [task for task,_ in requests]
+            futures = [future for _,future in requests]
+            done = loop.run_in_executor(self.executor,_crack_tasks,tasks)
+            done.add_done_callback(lambda done,tasks=tasks,futures=futures:
+                                                    _resolve(done,tasks,futures,in_flight))
+
+    def _task(self,line,line_number):
+        """Get the (id, ciphertext, language, variant, max_period) task of a request line
+
+        Raises batch.RecordError if the request is not valid.
+        """
+        identifier, ciphertext, record = batch.parse_record(line,line_number)
+        language = record.get('language',self.language)
+        variant = record.get('variant',self.variant)
+        if not isinstance(language,str):
+            raise batch.RecordError(identifier,'"language" must be a string')
+        try:
+            get_language(language)
+        except ValueError as error:
+            raise batch.RecordError(identifier,str(error))
+        if variant not in TabulaRecta.variants:
+            raise batch.RecordError(identifier,'Unknown variant: {0} (available: {1})'.format(
+                                                variant,', '.join(TabulaRecta.variants)))
+
+        return identifier, ciphertext, language, variant, self.max_period
+
+    async def _answer(self,future,writer,lock):
+        """Write the result of a request when it is ready"""
+        result = await future
+        async with lock:
+            writer.write((json.dumps(result,ensure_ascii=False) + '\n').encode('utf-8'))
+            await writer.drain()
+
+    async def _readline(self,reader):
+        """Read a request line, or b'' at the end of the connection
+
+        Raises ValueError after skipping a line longer than line_limit.
+        """
+        try:
+            return await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as error:
+            return error.partial
+        except asyncio.LimitOverrunError:
+            pass
+        while True:
+            try:
+                await reader.readuntil(b'\n')
+                break
+            except asyncio.IncompleteReadError:
+                break
+            except asyncio.LimitOverrunError as error:
+                await reader.readexactly(error.consumed)
+        raise ValueError('The request is longer than {0} bytes'.format(self.line_limit))
+
+    async def _handle(self,reader,writer):
+        """Read the requests of a connection until it is closed"""
+        loop = asyncio.get_running_loop()
+        lock = asyncio.Lock()
+        answers = set()
+        line_number = 0
+        while True:
+            overrun = None
+            try:
+                line = await self._readline(reader)
+            except ValueError as error:
+                line, overrun = None, error
+            if line == b'':
+                break
+            line_number += 1
+            if line is not None and not line.strip():
+                continue
+            future = loop.create_future()
+            if overrun is not None:
+                future.set_result(batch.error_result(line_number,overrun))
+            else:
+                try:
+                    task = self._task(line,line_number)
+                except batch.RecordError as error:
+                    future.set_result(batch.error_result(error.identifier,error))
+                else:
+                    await self.queue.put((task,future))
+            answer = asyncio.ensure_future(self._answer(future,writer,lock))
+            answers.add(answer)
+            answer.add_done_callback(answers.discard)
+
+        await asyncio.gather(*answers)
+        writer.close()
+
+    async def serve(self,address):
+        """Serve forever on a Unix socket path or a HOST:PORT address"""
+        self.queue = asyncio.Queue(self.queue_size)
+        self.executor = self._start_executor()
+        if self.jobs > 0:
+            # the pool starts a worker per task while none is idle, so this
+            # starts all of them before the first request has to wait
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(self.executor,CrackVigenere.preload,
+                                                        self.language) for _ in range(self.jobs)])
+        batcher = asyncio.ensure_future(self._batcher())
+        if ':' in address:
+            host, _, port = address.rpartition(':')
+            server = await asyncio.start_server(self._handle,host,int(port),
+                                                        limit=self.line_limit)
+        else:
+            server = await asyncio.start_unix_server(self._handle,address,
+                                                            limit=self.line_limit)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown()
+
+
+def _crack_tasks(tasks):
+    """Crack a micro-batch of (id, ciphertext, language, variant, max_period) tasks
+
+    A task that fails gives an error result instead of failing the batch.
+    """
+    results = []
+    for identifier,ciphertext,language,variant,max_period in tasks:
+        try:
+            results.append(batch.crack(identifier,ciphertext,language,variant,max_period))
+        except Exception as error:
+            results.append(batch.error_result(identifier,error))
+    return results
+
+def _resolve(done,tasks,futures,in_flight):
+    """Pass the results of a micro-batch to the futures of its requests"""
+    in_flight.release()
+    if done.cancelled():
+        return
+    error = done.exception()
+    if error is not None:
+        # the worker itself failed (e.g. it was killed)
+        for (identifier,*_),future in zip(tasks,futures):
+            if not future.done():
+                future.set_result(batch.error_result(identifier,error))
+        return
+    for future,result in zip(futures,done.result()):
+        if not future.done():
+            future.set_result(result)
+
+def serve(address,language='English',jobs=None,batch_size=16,queue_size=1024,variant='vigenere',
+                max_period=None):
+    """Run a CrackService until interrupted"""
+    service = CrackService(language,jobs,batch_size,queue_size,variant,max_period)
+    try:
+        asyncio.run(service.serve(address))
+    except KeyboardInterrupt:
+        pass
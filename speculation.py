@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import time
+from crack_vigenere import CrackVigenere
+from results import Speculation, notify
+
+def crack_best(context,periods,top=3,threshold=0.75,refine=True,variant='vigenere'):
+    """Crack the top candidate periods and keep the most fluent plaintext
+
+    periods are the candidates from the most to the least probable (e.g.
+    PeriodGuess.periods). Each one is cracked and its plaintext scored with
+    the mean n-gram log-probability of the language, mapped to a confidence
+    between random letters (0) and the language (1). The first candidate
+    whose confidence reaches threshold wins and the rest are skipped;
+    otherwise the most confident one wins. A multiple of the period gives
+    the right plaintext with a repeated key, so the key of the winner is
+    reduced to its shortest repeating unit.
+    """
+    if top < 1:
+        raise ValueError('The number of periods to crack must be positive: {0}'.format(top))
+    cracker = CrackVigenere(context,variant=variant)
+    speculation = Speculation()
+    start = time.perf_counter()
+    cracked = []
+    for period,_ in periods[:top]:
+        result = cracker.crack(period,refine)
+        fitness = cracker.fitness(result)
+        confidence = 0.0 if fitness is None else cracker.confidence(fitness)
+        cracked.append(result)
+        speculation.candidates.append((period,fitness,confidence))
+        if confidence >= threshold:
+            speculation.stopped_early = len(cracked) < min(top,len(periods))
+            break
+
+    if cracked:
+        index = max(range(len(cracked)),key=lambda index: speculation.candidates[index][2])
+        winner = cracked[index]
+        winner.period, winner.key = _shortest_key(winner.key)
+        speculation.winner = winner
+        speculation.winner_index = index
+        speculation.confidence = speculation.candidates[index][2]
+    speculation.timings['speculation'] = time.perf_counter() - start
+    notify(speculation)
+
+    return speculation
+
+def _shortest_key(key):
+    """Get the period and the shortest key that repeated gives key"""
+    for period in range(1,len(key)):
+        if len(key) % period == 0 and key[:period]*(len(key)//period) == key:
+            return period, key[:period]
+    return len(key), key
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+class TabulaRecta(object):
+    """Encrypt/decrypt alphabet-coded texts with precomputed translation tables
+
+    Texts are bytes objects of alphabet indices (see NormalizedText). Each
+    letter of a periodic key selects one table, and a residue class of the
+    text is translated with bytes.translate in a single pass, so the work per
+    character is done in C instead of Python code.
+
+    The variants of the cipher, with c, p and k the indices of the
+    ciphertext, plaintext and key letters (modulo the size of the alphabet):
+
+        vigenere            c = p + k       p = c - k
+        beaufort            c = k - p       p = k - c
+        variant_beaufort    c = p - k       p = c + k
+
+    The key letter with index i shifts by k = i + key_offset. By default
+    the Vigenère cipher keeps the convention of this program (A shifts by
+    1, B by 2, ...) and the Beaufort ciphers use the usual one (A shifts by
+    0), so KEY encrypts HELLO to DANZQ with the Beaufort cipher.
+    """
+    variants = ('vigenere','beaufort','variant_beaufort')
+    default_key_offsets = {'vigenere':1,'beaufort':0,'variant_beaufort':0}
+
+    def __init__(self,alphabet,variant='vigenere',key_offset=None):
+        if variant not in TabulaRecta.variants:
+            raise ValueError('Unknown variant: {0} (available: {1})'.format(
+                                        variant,', '.join(TabulaRecta.variants)))
+        if key_offset is None:
+            key_offset = TabulaRecta.default_key_offsets[variant]
+        self.alphabet = alphabet
+        self.variant = variant
+        self.key_offset = key_offset
+        size = len(alphabet)
+        rest = list(range(size,256))
+        # shift tables (code -> code + shift) and reflection tables (code -> shift - code)
+        self.tables = [bytes([(code+shift)%size for code in range(size)] + rest)
+                                for shift in range(size)]
+        self.reflections = [bytes([(shift-code)%size for code in range(size)] + rest)
+                                    for shift in range(size)]
+
+        if variant == 'vigenere':
+            self.encryption_tables = self.tables
+            self.decryption_tables = [self.tables[-shift%size] for shift in range(size)]
+        elif variant == 'beaufort':
+            self.encryption_tables = self.reflections
+            self.decryption_tables = self.reflections
+        else:
+            self.encryption_tables = [self.tables[-shift%size] for shift in range(size)]
+            self.decryption_tables = self.tables
+
+    def key_shifts(self,key):
+        """Shifts of the letters of the key (A shifts by key_offset, ...)"""
+        if not key:
+            raise ValueError('The key is empty')
+        return [self.alphabet.index(keyletter) + self.key_offset for keyletter in key.upper()]
+
+    def keyword(self,shifts):
+        """Get the key whose letters have the shifts"""
+        return ''.join([self.alphabet[(shift-self.key_offset)%len(self.alphabet)]
+                                for shift in shifts])
+
+    def translate(self,codes,tables):
+        """Translate the position i of codes with tables[i % len(tables)]"""
+        period = len(tables)
+        if period == 1:
+            return codes.translate(tables[0])
+
+        translated = bytearray(len(codes))
+        for phase,table in enumerate(tables):
+            translated[phase::period] = codes[phase::period].translate(table)
+
+        return bytes(translated)
+
+    def shift(self,codes,shifts):
+        """Shift the position i of codes by shifts[i % len(shifts)]"""
+        size = len(self.alphabet)
+        return self.translate(codes,[self.tables[shift%size] for shift in shifts])
+
+    def shift_many(self,codes,shifts_list):
+        """Shift the same codes with several periodic keys"""
+        return [self.shift(codes,shifts) for shifts in shifts_list]
+
+    def encryption_key_tables(self,key):
+        """Encryption tables of the letters of the key"""
+        size = len(self.alphabet)
+        return [self.encryption_tables[shift%size] for shift in self.key_shifts(key)]
+
+    def decryption_key_tables(self,key):
+        """Decryption tables of the letters of the key"""
+        size = len(self.alphabet)
+        return [self.decryption_tables[shift%size] for shift in self.key_shifts(key)]
+
+    def encrypt_many(self,codes,keys):
+        """Encrypt the same codes with each of the keys"""
+        return [self.translate(codes,self.encryption_key_tables(key)) for key in keys]
+
+    def decrypt_many(self,codes,keys):
+        """Decrypt the same codes with each of the keys"""
+        return [self.translate(codes,self.decryption_key_tables(key)) for key in keys]
+
+    # Every variant is a Vigenère cipher once the ciphertext is mapped to
+    # c' = c (vigenere), c' = -c (beaufort: c' = p - k) or kept as it is
+    # (variant_beaufort: c' = p - k), with shift s = k or s = -k. The
+    # cracker works in that space and converts the shifts back.
+
+    def vigenere_code(self,code):
+        """Map a ciphertext code to the Vigenère space (an involution)"""
+        if self.variant == 'beaufort':
+            return -code%len(self.alphabet)
+        return code
+
+    def vigenere_columns(self,columns):
+        """Map ciphertext columns to the Vigenère space"""
+        if self.variant == 'beaufort':
+            return [column.translate(self.reflections[0]) for column in columns]
+        return columns
+
+    def vigenere_counts(self,counts):
+        """Map the letter counts of a ciphertext column to the Vigenère space"""
+        if self.variant == 'beaufort':
+            return [counts[-code%len(counts)] for code in range(len(counts))]
+        return counts
+
+    def vigenere_shift(self,shift):
+        """Map a key shift to a Vigenère shift and back (an involution)"""
+        if self.variant == 'vigenere':
+            return shift%len(self.alphabet)
+        return -shift%len(self.alphabet)
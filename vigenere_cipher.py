@@ -1,59 +1,60 @@
 #!/usr/bin/env python3
 
-from itertools import cycle
-import string
+from language_model import get_language
+from normalized_text import NormalizedText
+from tabula_recta import TabulaRecta
 
 class VigenereCipher(object):
-    """Encrypt/decrypt a text using Vigenère's cipher """
-    def __init__(self,language='English'):
-        if language == 'English':
-            self.alphabet = string.ascii_uppercase
-        elif language == 'Spanish':
-            self.alphabet = "ABCDEFGHIJKLMNÑOPQRSTUVWXYZ"
-        else:
-            raise ValueError('Language must be English or Spanish')
-
-    def _clean_text(self,text):
-        """Extract the characters that belong to the alphabet"""
-        clean_text = ""
-        for letter in text.upper():
-            if letter in self.alphabet:
-                clean_text = ''.join((clean_text,letter))
-
-        return clean_text
-
-    def _rebuilt_text(self,text,original_text):
-        """Add the characters extracted before with _clean_text() """
-        rebuilt_text = list(text)
-        for pos,letter in enumerate(original_text.upper()):
-            if letter not in self.alphabet:
-                rebuilt_text.insert(pos,letter)
-
-        return ''.join(rebuilt_text)
+    """Encrypt/decrypt a text using Vigenère's cipher
+
+    variant selects the Beaufort ciphers instead (see TabulaRecta) and
+    key_offset the shift of the first letter of the alphabet (by default 1
+    for the Vigenère cipher and 0 for the Beaufort ciphers).
+    """
+    def __init__(self,language='English',variant='vigenere',key_offset=None):
+        self.language_model = get_language(language)
+        self.alphabet = self.language_model.alphabet
+
+        self.tabula_recta = TabulaRecta(self.alphabet,variant,key_offset)
 
     def encrypt(self,text,key):
         """Encrypt the text using Vigeneré's cipher."""
-        plaintext = self._clean_text(text)
-        encrypted_text = []
-        for letter,keyletter in zip(plaintext.upper(),cycle(key.upper())):
-            offset = self.alphabet.index(keyletter) + 1
-            pos = self.alphabet.index(letter)
-            encrypted_text.append(self.alphabet[(pos+offset)%len(self.alphabet)])
-        encrypted_text = ''.join(encrypted_text)
-
-        return self._rebuilt_text(encrypted_text,text)
+        return self.encrypt_many(text,[key])[0]
 
     def decrypt(self,text,key):
         """Decrypt the text using Vigeneré's cipher."""
-        ciphertext = self._clean_text(text)
-        decrypted_text = []
-        for letter,keyletter in zip(ciphertext.upper(),cycle(key.upper())):
-            offset = self.alphabet.index(keyletter) + 1
-            pos = self.alphabet.index(letter)
-            decrypted_text.append(self.alphabet[(pos-offset)%len(self.alphabet)])
-        decrypted_text = ''.join(decrypted_text)
-
-        return self._rebuilt_text(decrypted_text,text)
+        return self.decrypt_many(text,[key])[0]
+
+    def encrypt_many(self,text,keys):
+        """Encrypt the same text with each of the keys."""
+        plaintext = NormalizedText(text,self.alphabet)
+
+        return [plaintext.rebuild_codes(codes) for codes
+                    in self.tabula_recta.encrypt_many(plaintext.codes,keys)]
+
+    def decrypt_many(self,text,keys):
+        """Decrypt the same text with each of the keys."""
+        ciphertext = NormalizedText(text,self.alphabet)
+
+        return [ciphertext.rebuild_codes(codes) for codes
+                    in self.tabula_recta.decrypt_many(ciphertext.codes,keys)]
+
+    def encrypt_stream(self,chunks,key):
+        """Encrypt an iterable of text chunks, keeping the key phase across chunks."""
+        return self._translate_stream(chunks,self.tabula_recta.encryption_key_tables(key))
+
+    def decrypt_stream(self,chunks,key):
+        """Decrypt an iterable of text chunks, keeping the key phase across chunks."""
+        return self._translate_stream(chunks,self.tabula_recta.decryption_key_tables(key))
+
+    def _translate_stream(self,chunks,tables):
+        """Translate each chunk with the key tables rotated to the letters seen so far"""
+        phase = 0
+        for chunk in chunks:
+            text = NormalizedText(chunk,self.alphabet)
+            rotated_tables = tables[phase:] + tables[:phase]
+            yield text.rebuild_codes(self.tabula_recta.translate(text.codes,rotated_tables))
+            phase = (phase + len(text))%len(tables)
 
 
 if __name__ == '__main__':